@@ -0,0 +1,243 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from gallery import EmbeddingGallery, EMBEDDING_DIM
+
+# Inverted lists scanned per query - the recall vs latency knob
+ANN_NPROBE = int(os.environ.get('ANN_NPROBE', 8))
+# Galleries smaller than this are searched exactly, as before
+ANN_EXACT_THRESHOLD = int(os.environ.get('ANN_EXACT_THRESHOLD', 5000))
+
+KMEANS_ITERATIONS = 10
+KMEANS_CHUNK = 8192
+
+
+def _assign(vectors, centroids):
+    """Nearest centroid for every row, computed in chunks to bound memory"""
+    assignment = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), KMEANS_CHUNK):
+        assignment[start:start + KMEANS_CHUNK] = np.argmax(vectors[start:start + KMEANS_CHUNK] @ centroids.T, axis=1)
+    return assignment
+
+
+def train_centroids(vectors, nlist, seed=0):
+    """Spherical k-means over L2-normalised vectors"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+
+    for _ in range(KMEANS_ITERATIONS):
+        assignment = _assign(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        counts = np.bincount(assignment, minlength=nlist)
+
+        # Re-seed empty lists from random vectors
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+
+        lengths = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.where(lengths == 0, 1, lengths)
+    return centroids.astype(np.float32)
+
+
+def _call(fn, *args):
+    return fn(*args)
+
+
+def _write_npz(path, arrays):
+    # Written next to the target and renamed, so a crash never leaves a truncated index
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+class IVFIndex:
+    """Inverted-file index over an EmbeddingGallery for campus-sized galleries
+
+    Matches fall back to the exact gallery search until the index holds at
+    least exact_threshold identities and has been trained.
+    """
+
+    def __init__(self, dim=EMBEDDING_DIM, nprobe=ANN_NPROBE, exact_threshold=ANN_EXACT_THRESHOLD):
+        self.gallery = EmbeddingGallery(dim)
+        self.nprobe = nprobe
+        self.exact_threshold = exact_threshold
+        self.centroids = None
+        self.trained_size = 0
+        self._lists = []  # list id -> gallery rows
+        self._row_list = np.zeros(0, dtype=np.int32)  # gallery row -> list id
+        self._lock = threading.Lock()
+        self._mutations = 0  # bumped by every add/remove, so training can tell if rows moved meanwhile
+        # Free-form bookkeeping persisted alongside the index (e.g. per-course store versions)
+        self.meta = {}
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.gallery)
+
+    def __contains__(self, name):
+        return name in self.gallery
+
+    @property
+    def names(self):
+        return self.gallery.names
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    def train(self, nlist=None, run=_call):
+        """(Re)build the inverted lists from everything currently in the gallery
+
+        run(fn, *args) executes the k-means, e.g. tpool.execute so an event loop keeps serving.
+        Matches use the previous lists (or exact search) until the new ones are swapped in.
+        """
+        with self._lock:
+            size = len(self.gallery)
+            if size < self.exact_threshold:
+                self.centroids = None
+                self._lists = []
+                return
+            vectors = np.array(self.gallery.matrix)
+            mutations = self._mutations
+
+        nlist = nlist or max(1, int(4 * np.sqrt(size)))
+        centroids = run(train_centroids, vectors, min(nlist, size))
+        assignment = run(_assign, vectors, centroids)
+
+        with self._lock:
+            if self._mutations != mutations:
+                # Rows were added or moved while training; place every current row
+                assignment = _assign(self.gallery.matrix, centroids)
+            self.centroids = centroids
+            self.trained_size = size
+            self._rebuild_lists(assignment)
+            self.dirty = True
+        print(f"Trained campus index: {size} identities in {len(self._lists)} lists")
+
+    def _rebuild_lists(self, assignment):
+        self._row_list = assignment.astype(np.int32)
+        self._lists = [[] for _ in range(len(self.centroids))]
+        for row, list_id in enumerate(assignment):
+            self._lists[list_id].append(row)
+
+    def add(self, name, embedding):
+        with self._lock:
+            existing = self.gallery.row(name)
+            if not self.gallery.add(name, embedding):
+                return False
+            self._mutations += 1
+            self.dirty = True
+            if self.centroids is None:
+                return True
+
+            row = self.gallery.row(name)
+            list_id = int(np.argmax(self.centroids @ self.gallery.matrix[row]))
+            if existing is not None:
+                self._lists[self._row_list[row]].remove(row)
+            else:
+                self._row_list = np.append(self._row_list, np.int32(list_id))
+            self._row_list[row] = list_id
+            self._lists[list_id].append(row)
+            return True
+
+    def remove(self, name):
+        with self._lock:
+            row = self.gallery.row(name)
+            if row is None:
+                return False
+            last = len(self.gallery) - 1
+            self.gallery.remove(name)
+            self._mutations += 1
+            self.dirty = True
+            if self.centroids is None:
+                return True
+
+            # Mirror the gallery's swap-with-last removal in the inverted lists
+            self._lists[self._row_list[row]].remove(row)
+            if row != last:
+                moved_list = self._lists[self._row_list[last]]
+                moved_list[moved_list.index(last)] = row
+                self._row_list[row] = self._row_list[last]
+            self._row_list = self._row_list[:last]
+            return True
+
+    def clear(self):
+        with self._lock:
+            self.gallery.clear()
+            self._mutations += 1
+            self.centroids = None
+            self.trained_size = 0
+            self._lists = []
+            self._row_list = np.zeros(0, dtype=np.int32)
+            self.meta = {}
+
+    def match(self, embedding):
+        names, similarities = self.match_many([embedding])
+        if not names:
+            return None, 0.0
+        return names[0], float(similarities[0])
+
+    def match_many(self, embeddings, nprobe=None):
+        if self.centroids is None:
+            return self.gallery.match_many(embeddings)
+
+        queries = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.gallery.dim)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1, norms)
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+
+        names = []
+        best_similarities = np.zeros(len(queries), dtype=np.float32)
+        with self._lock:
+            matrix = self.gallery.matrix
+            probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+            for q, query in enumerate(queries):
+                rows = [row for list_id in probes[q] for row in self._lists[list_id]]
+                if not rows:
+                    # Every probed list is empty - scan everything rather than miss
+                    rows = list(range(len(matrix)))
+                similarities = matrix[rows] @ query
+                best = int(np.argmax(similarities))
+                names.append(self.gallery.name_at(rows[best]))
+                best_similarities[q] = similarities[best]
+        return names, best_similarities
+
+    def save(self, path, run=_call):
+        """Persist vectors, names and the trained lists to a single .npz file
+
+        The arrays are copied under the lock and written by run(fn, *args), like train().
+        """
+        with self._lock:
+            arrays = dict(
+                names=np.array(self.gallery.names),
+                vectors=np.array(self.gallery.matrix),
+                centroids=self.centroids if self.centroids is not None else np.zeros((0, self.gallery.dim)),
+                assignment=self._row_list.copy() if self.centroids is not None else np.zeros(0, dtype=np.int32),
+                trained_size=self.trained_size,
+                meta=np.array(json.dumps(self.meta))
+            )
+            self.dirty = False
+        try:
+            run(_write_npz, path, arrays)
+        except Exception:
+            self.dirty = True
+            raise
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        index = cls(**kwargs)
+        with np.load(path) as data:
+            for name, vector in zip(data['names'], data['vectors']):
+                index.gallery.add(str(name), vector)
+            index.meta = json.loads(str(data['meta']))
+            if len(data['centroids']):
+                index.centroids = data['centroids'].astype(np.float32)
+                index._rebuild_lists(data['assignment'])
+                index.trained_size = int(data['trained_size'])
+        return index
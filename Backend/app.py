@@ -1,36 +1,154 @@
 import eventlet
+from eventlet import tpool
 
 eventlet.monkey_patch()
 
 import os
-import pandas as pd
 import base64
 import numpy as np
 import cv2
-import io
 import time
 import threading
 import json
-from flask import Flask, request, jsonify
+import uuid
+import hashlib
+from collections import OrderedDict
+from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
 from flask_socketio import SocketIO
 from datetime import date
-from deepface import DeepFace
-from mtcnn import MTCNN
-from PIL import Image
-from numpy.linalg import norm
 from datetime import datetime
+from gallery import GalleryGroup
+from gallery_cache import GalleryCache
+from ann_index import IVFIndex
+import gallery_store
+import attendance_store
+import roster_store
+from catalog import Catalog
+from session_attendance import SessionAttendance, MIN_VOTES as ATTENDANCE_MIN_VOTES
+import metrics
+from face_embedding import represent_batch, MAX_BATCH_SIZE
+from inference_scheduler import InferenceScheduler, SchedulerBusyError
+from tracking import FaceTracker, TRACK_AGGREGATION
+from frame_scheduler import FrameScheduler
+import face_detection
+from face_pool import FacePool, WORKER_PROCESSES
+from face_quality import registration_crops, robust_mean_embedding
+import recognition
+
+# With FACE_WORKER_PROCESSES > 0 the models live in worker processes instead of here
+face_pool = FacePool(WORKER_PROCESSES) if WORKER_PROCESSES > 0 else None
+
+
+def represent_off_hub(crops):
+    # The green threads share one OS thread, so TensorFlow runs in eventlet's native pool instead
+    return tpool.execute(represent_batch, crops)
+
+
+embed_faces = face_pool.represent_batch if face_pool is not None else represent_off_hub
+
+# Set once the detector and ArcFace have been built and run on a dummy input
+models_ready = threading.Event()
+
+# One gallery per (intake, course), shared by every session that uses it
+gallery_cache = GalleryCache()
+# Galleries selected through /load-embeddings for /recognize-face
+gallery = GalleryGroup()
+processing_lock = threading.Lock()
 
-detector = MTCNN()
+# Every enrolled student under Students/, used by "whole campus" sessions
+CAMPUS_INDEX_PATH = os.path.join('Students', 'campus_index.npz')
+campus_index = None
+campus_mode = False
+# Serialises syncs of the campus index; training and saving run as one background task at a time
+campus_index_lock = threading.Lock()
+campus_maintenance_running = False
 
-loaded_embeddings = {}
-processing_lock = threading.Lock()
+# Shares ArcFace batches between all clients streaming frames
+inference_scheduler = InferenceScheduler(embed_faces, MAX_BATCH_SIZE)
 
 app = Flask(__name__)
-CORS(app)  # Allow frontend to access backend
+CORS(app, expose_headers=['ETag'])  # Allow frontend to access backend
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet', ping_timeout=10, ping_interval=5)
 
-recent_recognitions = {}
+# Per Socket.IO session: the gallery it matches against, its recognition debounce and face tracks
+sessions = {}
+# Per Socket.IO session: newest pending frame and measured processing rate
+frame_schedulers = {}
+
+# Per-frame and per-face prints are only shown with LOG_LEVEL=DEBUG
+DEBUG_LOGGING = os.environ.get('LOG_LEVEL', 'INFO').upper() == 'DEBUG'
+
+stage_seconds = metrics.Histogram('face_stage_seconds', 'Time spent in each recognition stage', 'stage')
+frames_received = metrics.Counter('face_frames_received_total', 'Frames received from Socket.IO clients')
+frames_dropped = metrics.Counter('face_frames_dropped_total', 'Frames dropped before recognition', 'reason')
+faces_recognised = metrics.Counter('face_recognitions_total', 'Faces recognised above the threshold')
+metrics.Gauge('face_gallery_embeddings', 'Embeddings in cached course galleries',
+              lambda: gallery_cache.total_embeddings)
+metrics.Gauge('face_scheduler_queue_depth', 'Embedding requests waiting for a batch',
+              lambda: inference_scheduler.queue_depth)
+metrics.Gauge('face_active_sessions', 'Socket.IO clients with recognition started', lambda: len(sessions))
+
+# Background registrations by job id, oldest first
+registration_jobs = OrderedDict()
+MAX_REGISTRATION_JOBS = 100
+# Intakes, courses and subjects for the dashboards' pickers
+catalog = Catalog()
+
+# Dashboard JSON by request key: (attendance version it was built from, body)
+analytics_cache = {}
+
+# Registration images decoded at the same time
+REGISTRATION_DECODE_CONCURRENCY = int(os.environ.get('REGISTRATION_DECODE_CONCURRENCY', 8))
+
+
+def debug(message):
+    if DEBUG_LOGGING:
+        print(message)
+
+
+def warm_up_models():
+    """Build the detector and ArcFace and run them once so the first frame is not slow"""
+    started = time.time()
+    try:
+        if face_pool is not None:
+            # Runs on the hub: the pool's executor threads must be green, and its futures yield
+            face_pool.warm_up()
+        else:
+            # Model building and the first passes run in a real OS thread so the hub keeps serving
+            tpool.execute(face_detection.detect_faces, np.zeros((160, 160, 3), dtype=np.uint8))
+            tpool.execute(represent_batch, [np.zeros((112, 112, 3), dtype=np.uint8)])
+        models_ready.set()
+        print(f"Models ready after {time.time() - started:.1f}s")
+    except Exception as e:
+        print(f"❌ Model warm-up failed: {e}")
+
+
+def active_gallery():
+    if campus_mode and campus_index is not None:
+        return campus_index
+    return gallery
+
+
+def decode_image(payload):
+    """Decode a frame sent as raw JPEG bytes or as a base64 string / data URL"""
+    if isinstance(payload, str):
+        # Skip the data URL prefix if present
+        payload = base64.b64decode(payload.split(',', 1)[1] if ',' in payload else payload)
+    return cv2.imdecode(np.frombuffer(payload, np.uint8), cv2.IMREAD_COLOR)
+
+
+def detect_faces(img, backend=None):
+    if face_pool is not None:
+        return face_pool.detect_faces(img, backend)
+    # Detection runs in a real OS thread so the hub keeps serving other clients meanwhile
+    return tpool.execute(face_detection.detect_faces, img, backend)
+
+
+def detect_faces_many(images, backend=None):
+    if face_pool is not None:
+        return face_pool.detect_faces_many(images, backend)
+    return [tpool.execute(face_detection.detect_faces, img, backend) for img in images]
 
 
 # Add WebSocket functionality
@@ -41,57 +159,107 @@ def handle_connect():
 
 @socketio.on('disconnect')
 def handle_disconnect():
+    session = sessions.pop(request.sid, None)
+    frame_schedulers.pop(request.sid, None)
+    # Nothing seen before a dropped connection is lost
+    if session and session['attendance']:
+        session['attendance'].flush()
     print('Client disconnected')
 
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    # Only report ready once the models are built and warm
+    if models_ready.is_set():
+        return jsonify({"ready": True})
+    return jsonify({"ready": False}), 503
+
+
 @app.route('/register', methods=['POST'])
 def register():
     data = request.get_json()
-    name = data['name']
-    studentid = data['studentid']
-    intake = data['intake']
-    course = data['course']
-    today = date.today().strftime('%Y-%m-%d')
 
-    # First create student embeddings
-    embedding_result = create_student_embeddings(data)
-    if "error" in embedding_result:
-        return jsonify({"message": embedding_result["error"]}), 400
+    # Enrolments can run as a background job that reports progress over Socket.IO
+    if data.get('background'):
+        job_id = uuid.uuid4().hex
+        registration_jobs[job_id] = {"status": "running", "message": "Registration started", "progress": None}
+        while len(registration_jobs) > MAX_REGISTRATION_JOBS:
+            registration_jobs.popitem(last=False)
+        socketio.start_background_task(run_registration_job, job_id, data)
+        return jsonify({"message": "Registration started", "job_id": job_id}), 202
 
-    folder_path = f"../Students/{intake}/{course}"
-    os.makedirs(folder_path, exist_ok=True)
+    body, status = register_student(data)
+    return jsonify(body), status
 
-    file_name = f"{intake} {course}.xlsx"
-    file_path = os.path.join(folder_path, file_name)
 
-    new_row = pd.DataFrame([{
-        "Name": name,
-        "StudentID": studentid,
-        "Intake": intake,
-        "Course": course,
-        "Date": today
-    }])
+@app.route('/register/status/<job_id>', methods=['GET'])
+def registration_status(job_id):
+    job = registration_jobs.get(job_id)
+    if job is None:
+        return jsonify({"message": "Unknown registration job"}), 404
+    return jsonify(job)
 
-    if os.path.exists(file_path):
-        df = pd.read_excel(file_path)
 
-        # 🔒 Convert all StudentID values to string and strip spaces
-        df['StudentID'] = df['StudentID'].astype(str).str.strip()
-        cleaned_studentid = str(studentid).strip()
+def run_registration_job(job_id, data):
+    # Progress goes to the requesting socket if it sent its sid, otherwise to everyone
+    sid = data.get('sid')
 
-        # ✅ Now check for duplicates
-        if cleaned_studentid in df['StudentID'].values:
-            print(f"Duplicate found for ID: {cleaned_studentid}")
-            return jsonify({"message": "Student ID already registered!"}), 400
+    def progress(stage, done, total):
+        registration_jobs[job_id]["progress"] = {"stage": stage, "done": done, "total": total}
+        socketio.emit('registration_progress', {
+            'job_id': job_id,
+            'stage': stage,
+            'done': done,
+            'total': total
+        }, to=sid)
 
-        df = pd.concat([df, new_row], ignore_index=True)
+    try:
+        body, status = register_student(data, progress)
+    except Exception as e:
+        print(f"Registration job {job_id} failed: {e}")
+        body, status = {"message": f"Registration failed: {str(e)}"}, 500
 
-    else:
-        df = new_row
+    registration_jobs[job_id].update({
+        "status": "done" if status == 200 else "failed",
+        "message": body["message"]
+    })
+    socketio.emit('registration_complete', {
+        'job_id': job_id,
+        'success': status == 200,
+        'message': body["message"]
+    }, to=sid)
+
+
+def register_student(data, progress=None):
+    """Create a student's embedding and roster entry; returns (response body, status)"""
+    name = data['name']
+    studentid = str(data['studentid']).strip()
+    intake = data['intake']
+    course = data['course']
+    today = date.today().strftime('%Y-%m-%d')
 
-    df.to_excel(file_path, index=False)
+    # Claim the ID before the expensive embedding step, so duplicates fail fast and never race
+    if not roster_store.add(intake, course, studentid, name, today):
+        print(f"Duplicate found for ID: {studentid}")
+        return {"message": "Student ID already registered!"}, 400
+
+    try:
+        embedding_result = create_student_embeddings(data, progress)
+    except Exception:
+        roster_store.remove(intake, course, studentid)
+        raise
+    if "error" in embedding_result:
+        roster_store.remove(intake, course, studentid)
+        return {"message": embedding_result["error"]}, 400
+
+    catalog.invalidate()
     print(f"Registered: {studentid} - {name}")
-    return jsonify({"message": "Student registered successfully!"})
+    return {"message": "Student registered successfully!"}, 200
 
 
 @app.route('/remove-student', methods=['POST'])
@@ -102,50 +270,51 @@ def remove_student():
     intake = data['intake']
     course = data['course']
 
-    file_path = os.path.join(f"../Students/{intake}/{course}", f"{intake} {course}.xlsx")
-
-    if not os.path.exists(file_path):
-        return jsonify({"message": "File not found for given intake and course."}), 404
-
-    df = pd.read_excel(file_path)
-
-    # Normalize for case-insensitive comparison
-    df['StudentID'] = df['StudentID'].astype(str).str.strip()
-    df['Name'] = df['Name'].astype(str).str.strip().str.lower()
-
-    # Check if row exists
-    match = (df['StudentID'] == studentid) & (df['Name'] == name)
-
-    if match.sum() == 0:
+    if not roster_store.remove(intake, course, studentid, name):
         return jsonify({"message": "No matching student found."}), 404
+    catalog.invalidate()
 
-    # Remove matching rows
-    df = df[~match]
-
-    # Save the updated file
-    df.to_excel(file_path, index=False)
-
-    # Also remove the embedding file if it exists
+    # Also remove the embedding from the packed store and any legacy file
+    if gallery_store.tombstone(os.path.join("Students", intake, course), studentid):
+        print(f"Removed embedding for {studentid} from {intake} {course} store")
     embedding_path = os.path.join(f"Students/{intake}/{course}", f"{name}_{studentid}.npy")
     if os.path.exists(embedding_path):
         os.remove(embedding_path)
         print(f"Removed embedding file: {embedding_path}")
 
+    # Drop the student from the live galleries so recognition stops matching them
+    gallery_cache.remove(intake, course, studentid)
+    remove_from_campus_index(f"{intake}/{course}", studentid)
+
     return jsonify({"message": "Student removed successfully!"})
 
 
 # New endpoint to handle load-embeddings request
 @app.route('/load-embeddings', methods=['POST'])
 def load_embeddings():
+    global campus_mode
     data = request.get_json()
     intakes = data.get('intakes', [])
     courses = data.get('courses', [])
 
+    if data.get('campus'):
+        try:
+            count = load_campus_index()
+            campus_mode = True
+            return jsonify({
+                "message": f"Successfully loaded {count} embeddings",
+                "count": count
+            })
+        except Exception as e:
+            print(f"Error loading campus index: {e}")
+            return jsonify({"message": f"Error loading embeddings: {str(e)}"}), 500
+
     if not intakes or not courses:
         return jsonify({"message": "Missing intake or course information"}), 400
 
     try:
         count = load_embeddings_for_courses(intakes, courses)
+        campus_mode = False
         return jsonify({
             "message": f"Successfully loaded {count} embeddings",
             "count": count
@@ -155,70 +324,71 @@ def load_embeddings():
         return jsonify({"message": f"Error loading embeddings: {str(e)}"}), 500
 
 
-def create_student_embeddings(data):
+def decode_images(payloads):
+    """Decode registration images in parallel on eventlet's OS thread pool"""
+    def decode(payload):
+        try:
+            return tpool.execute(decode_image, payload)
+        except Exception as e:
+            print(f"Error decoding image: {e}")
+            return None
+
+    return list(eventlet.GreenPool(REGISTRATION_DECODE_CONCURRENCY).imap(decode, payloads))
+
+
+def create_student_embeddings(data, progress=None):
     name = data['name']
     studentid = str(data['studentid'])
     intake = data['intake']
     course = data['course']
     images = data['images']  # 30 base64 images
 
+    def report(stage, done):
+        if progress:
+            progress(stage, done, len(images))
+
     # Folder path
     folder_path = os.path.join("Students", intake, course)
     os.makedirs(folder_path, exist_ok=True)
 
-    embeddings = []
-    valid_images = 0
-
-    for i, img_base64 in enumerate(images):
-        try:
-            # Skip the data URL prefix if present
-            if ',' in img_base64:
-                img_data = base64.b64decode(img_base64.split(',')[1])
-            else:
-                img_data = base64.b64decode(img_base64)
-
-            nparr = np.frombuffer(img_data, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-            if img is None or img.size == 0:
-                print(f"Image {i} is invalid")
-                continue
-
-            # Detect face
-            results = detector.detect_faces(img)
-            if not results:
-                print(f"No face detected in image {i}")
-                continue
-
-            x, y, w, h = results[0]['box']
-            x, y = max(0, x), max(0, y)
-            cropped = img[y:y + h, x:x + w]
-
-            if cropped.size == 0:
-                print(f"Cropped face in image {i} is empty")
-                continue
+    decoded = []
+    for i, img in enumerate(decode_images(images)):
+        if img is None or img.size == 0:
+            print(f"Image {i} is invalid")
+            continue
+        decoded.append((i, img))
+    report('decode', len(decoded))
 
-            # Resize and preprocess
-            cropped = cv2.resize(cropped, (112, 112))
+    # Detect faces in all images at once (spread over the workers in pool mode)
+    try:
+        detections = detect_faces_many([img for _, img in decoded])
+    except Exception as e:
+        print(f"Face detection error: {e}")
+        detections = []
+    report('detect', len(detections))
 
-            # Get embedding
-            try:
-                emb = DeepFace.represent(cropped, model_name='ArcFace', enforce_detection=False)[0]['embedding']
-                embeddings.append(emb)
-                valid_images += 1
-                print(f"Processed image {i} successfully")
-            except Exception as e:
-                print(f"Embedding error for image {i}: {e}")
+    crops = registration_crops(decoded, detections)
 
+    # Embed every valid crop in a single batched pass
+    embeddings = []
+    if crops:
+        try:
+            embeddings = embed_faces(crops)
         except Exception as e:
-            print(f"Error processing image {i}: {e}")
-
-    # Save mean embedding
-    if embeddings:
-        mean_embedding = np.mean(embeddings, axis=0)
-        filename = f"{name}_{studentid}.npy"
-        np.save(os.path.join(folder_path, filename), mean_embedding)
+            print(f"Embedding error: {e}")
+    report('embed', len(embeddings))
+
+    # Save mean embedding, ignoring outliers such as a wrong face or a bad crop
+    if len(embeddings):
+        mean_embedding, valid_images = robust_mean_embedding(embeddings)
+        gallery_store.migrate_npy_files(folder_path)
+        gallery_store.append(folder_path, name, studentid, mean_embedding)
         print(f"Created embedding from {valid_images} valid images")
+
+        # Keep a running session in sync without reloading the whole course
+        gallery_cache.add(intake, course, f"{name}_{studentid}", mean_embedding)
+        add_to_campus_index(f"{intake}/{course}", f"{name}_{studentid}", mean_embedding)
+        report('save', valid_images)
         return {"success": f"Embedding created from {valid_images} images"}
     else:
         print("No valid faces found in the images")
@@ -227,11 +397,8 @@ def create_student_embeddings(data):
 
 def load_embeddings_for_courses(intakes, courses):
     """Load embeddings for specific intakes and courses"""
-    global loaded_embeddings
-
-    base_path = 'Students'
-    loaded_embeddings.clear()
-    count = 0
+    global gallery
+    galleries = []
 
     # Make sure we're working with lists
     if not isinstance(intakes, list):
@@ -244,88 +411,201 @@ def load_embeddings_for_courses(intakes, courses):
             intake = intake_item[0] if isinstance(intake_item, list) else intake_item
             course = course_item[0] if isinstance(course_item, list) else course_item
 
-            path = os.path.join(base_path, intake, course)
-            if os.path.exists(path):
-                for file in os.listdir(path):
-                    if file.endswith('.npy'):
-                        name = file.replace('.npy', '')
-                        try:
-                            embedding = np.load(os.path.join(path, file))
-                            embedding = embedding / np.linalg.norm(embedding)
-                            loaded_embeddings[name] = embedding
-                            count += 1
-                        except Exception as e:
-                            print(f"Error loading embedding {file}: {e}")
+            try:
+                galleries.append(gallery_cache.get(intake, course))
+            except Exception as e:
+                print(f"Error loading embeddings for {intake} {course}: {e}")
 
+    # Swap in a new group rather than clearing, so running sessions keep their galleries
+    gallery = GalleryGroup(galleries)
+    count = len(gallery)
     print(f"Loaded {count} embeddings")
     return count
 
 
-def cosine_similarity(a, b):
-    return np.dot(a, b) / (norm(a) * norm(b))
+def add_to_campus_index(source, key, embedding):
+    """Add one enrolment to a loaded campus index, recording which store it came from"""
+    if campus_index is None:
+        return
+    campus_index.add(key, embedding)
+    keys = campus_index.meta.setdefault('keys', {}).setdefault(source, [])
+    if key not in keys:
+        keys.append(key)
+    campus_index.dirty = True
+
+
+def remove_from_campus_index(source, studentid):
+    """Drop a student's keys that came from one store, leaving other courses' enrolments alone"""
+    if campus_index is None:
+        return
+    keys_by_source = campus_index.meta.setdefault('keys', {})
+    keys = keys_by_source.get(source, [])
+    for key in [key for key in keys if key.rsplit('_', 1)[-1] == studentid]:
+        keys.remove(key)
+        holders = [other for other, other_keys in keys_by_source.items() if key in other_keys]
+        if holders:
+            # The same key is enrolled elsewhere: reload it from those stores on the next sync
+            for other in holders:
+                campus_index.meta.setdefault('versions', {}).pop(other, None)
+        else:
+            campus_index.remove(key)
+    campus_index.dirty = True
+
+
+def load_campus_index():
+    """Sync the campus-wide index with every embedding store under Students/"""
+    with campus_index_lock:
+        count = sync_campus_index()
+    start_campus_maintenance()
+    return count
+
+
+def sync_campus_index():
+    global campus_index
+
+    base_path = 'Students'
+    if campus_index is None:
+        if os.path.exists(CAMPUS_INDEX_PATH):
+            # Tens of thousands of rows: built in a real OS thread so the hub keeps serving
+            campus_index = tpool.execute(IVFIndex.load, CAMPUS_INDEX_PATH)
+        else:
+            campus_index = IVFIndex()
+
+    # Only stores whose manifest version changed since the last sync are reloaded
+    versions = campus_index.meta.setdefault('versions', {})
+    keys_by_source = campus_index.meta.setdefault('keys', {})
+    seen = set()
+    if os.path.exists(base_path):
+        for intake in os.listdir(base_path):
+            intake_path = os.path.join(base_path, intake)
+            if not os.path.isdir(intake_path):
+                continue
+            for course in os.listdir(intake_path):
+                path = os.path.join(intake_path, course)
+                if not os.path.isdir(path):
+                    continue
+                source = f"{intake}/{course}"
+                try:
+                    gallery_store.migrate_npy_files(path)
+                    manifest = gallery_store.read_manifest(path)
+                    if manifest is None:
+                        continue
+                    seen.add(source)
+                    if versions.get(source) == manifest['version']:
+                        continue
+
+                    keys, matrix, version = gallery_store.load(path)
+                    for key in set(keys_by_source.get(source, [])) - set(keys):
+                        campus_index.remove(key)
+                    for key, vector in zip(keys, matrix):
+                        campus_index.add(key, vector)
+                    versions[source] = version
+                    keys_by_source[source] = keys
+                    campus_index.dirty = True
+                except Exception as e:
+                    print(f"Error loading embedding store {path}: {e}")
+                # Let other clients in between courses
+                socketio.sleep(0)
+
+    for source in set(versions) - seen:
+        for key in keys_by_source.pop(source, []):
+            campus_index.remove(key)
+        versions.pop(source)
+
+    print(f"Campus index holds {len(campus_index)} embeddings")
+    return len(campus_index)
+
+
+def campus_index_needs_training():
+    # Retrain once the gallery has outgrown the lists it was clustered with
+    return len(campus_index) >= campus_index.exact_threshold and (
+        not campus_index.trained or len(campus_index) > 2 * campus_index.trained_size)
+
+
+def start_campus_maintenance():
+    global campus_maintenance_running
+    if campus_maintenance_running or not (campus_index_needs_training() or campus_index.dirty):
+        return
+    campus_maintenance_running = True
+    socketio.start_background_task(maintain_campus_index)
+
+
+def maintain_campus_index():
+    """Train and save the campus index off the hub; matching keeps using exact search (or the old lists) meanwhile"""
+    global campus_maintenance_running
+    try:
+        if campus_index_needs_training():
+            campus_index.train(run=tpool.execute)
+        if campus_index.dirty:
+            campus_index.save(CAMPUS_INDEX_PATH, run=tpool.execute)
+    except Exception as e:
+        print(f"❌ Campus index maintenance failed: {e}")
+    finally:
+        campus_maintenance_running = False
 
 
 @app.route('/recognize-face', methods=['POST'])
 def recognize_face():
-    global loaded_embeddings
     start = time.time()
 
     # Check if embeddings are loaded
-    if not loaded_embeddings:
+    if not len(active_gallery()):
         return jsonify({"message": "No embeddings loaded. Please load embeddings first."}), 400
 
-    data = request.get_json()
-
     try:
-        # Process the incoming image
-        img_data = data['image'].split(',')[1]
-        img_bytes = base64.b64decode(img_data)
-        img = Image.open(io.BytesIO(img_bytes)).convert('RGB')
-        img_np = np.array(img)
+        # Process the incoming image - raw JPEG bytes or JSON with a base64 data URL
+        with stage_seconds.time('decode'):
+            if request.mimetype == 'application/octet-stream':
+                img_np = decode_image(request.get_data())
+            else:
+                img_np = decode_image(request.get_json()['image'])
+
+        if img_np is None or img_np.size == 0:
+            return jsonify({"message": "Invalid image"}), 400
 
         # Detect faces in the image
-        faces = detector.detect_faces(img_np)
+        with stage_seconds.time('detect'):
+            faces = detect_faces(img_np)
         if not faces:
-            print("⚠️ No face detected")
+            debug("⚠️ No face detected")
             return jsonify({"message": "No face detected"}), 400
 
         # Process the detected face
         face = faces[0]
         x, y, w, h = face["box"]
-        print(f"🔍 Face detected at: {x},{y},{w},{h}")
+        debug(f"🔍 Face detected at: {x},{y},{w},{h}")
 
         # Crop and preprocess the face
-        cropped_face = img_np[y:y + h, x:x + w]
-        cropped_face = cv2.resize(cropped_face, (112, 112))
+        with stage_seconds.time('crop'):
+            cropped_face = img_np[y:y + h, x:x + w]
+            cropped_face = cv2.resize(cropped_face, (112, 112))
 
         # Generate embedding for the detected face
         try:
-            new_embedding = DeepFace.represent(cropped_face, model_name='ArcFace', enforce_detection=False)[0][
-                'embedding']
+            with stage_seconds.time('embed'):
+                new_embedding = inference_scheduler.submit([cropped_face])[0][0]
+        except SchedulerBusyError as e:
+            frames_dropped.inc('busy')
+            debug(f"⏭️ Rejecting recognition: {e}")
+            return jsonify({"message": "Server is busy, please retry"}), 503
         except Exception as e:
             print(f"❌ Embedding error: {e}")
             return jsonify({"message": "Failed to generate face embedding"}), 400
 
         # Find the best match
-        best_match = None
-        best_similarity = 0
-
-        for name, saved_emb in loaded_embeddings.items():
-            similarity = cosine_similarity(new_embedding, saved_emb)
-            print(f"Similarity with {name}: {similarity:.4f}")
-
-            if similarity > best_similarity:
-                best_similarity = similarity
-                best_match = name
+        with stage_seconds.time('match'):
+            best_match, best_similarity = active_gallery().match(new_embedding)
 
         # Check if the best match exceeds the threshold
         if best_similarity > 0.75:
-            print(f"✅ Recognized {best_match} (similarity: {best_similarity:.4f})")
+            faces_recognised.inc()
+            debug(f"✅ Recognized {best_match} (similarity: {best_similarity:.4f})")
             elapsed = time.time() - start
-            print(f"🕒 Processing time: {elapsed:.2f}s")
+            stage_seconds.observe('total', elapsed)
+            debug(f"🕒 Processing time: {elapsed:.2f}s")
             return jsonify({"name": best_match, "box": [x, y, w, h], "similarity": float(best_similarity)})
         else:
-            print(f"❌ Best match {best_match} with similarity {best_similarity:.4f} below threshold")
+            debug(f"❌ Best match {best_match} with similarity {best_similarity:.4f} below threshold")
             return jsonify({"message": "Person not recognized", "best_match": best_match,
                             "similarity": float(best_similarity)}), 404
 
@@ -336,10 +616,28 @@ def recognize_face():
 
 @socketio.on('start_recognition')
 def start_recognition(data, callback=None):
-    global recent_recognitions
-
-    # Clear the recognition cache when starting
-    recent_recognitions = {}
+    # Each session gets its own gallery reference and an empty recognition cache
+    session = {'gallery': None, 'recent_recognitions': {}, 'tracker': FaceTracker(), 'detector': None,
+               'attendance': None, 'aggregate': bool(data.get('aggregate', TRACK_AGGREGATION))}
+    previous = sessions.get(request.sid)
+    sessions[request.sid] = session
+    # Restarting on the same socket must not lose the previous session's pending sightings
+    if previous and previous['attendance']:
+        previous['attendance'].flush()
+
+    # Optional per-session detector backend, e.g. a cheap one for a low-powered room
+    detector_backend = data.get('detector')
+    if detector_backend in face_detection.BACKENDS:
+        session['detector'] = detector_backend
+
+    # Whole campus mode matches against every enrolled student
+    if data.get('campus'):
+        load_campus_index()
+        session['gallery'] = campus_index
+        print(f"Recognition started with {len(campus_index)} campus embeddings")
+        if callback:
+            callback({'status': 'success', 'message': 'Recognition started'})
+        return {'status': 'success', 'message': 'Recognition started'}
 
     # Get intake and course as strings
     intake = data.get('intake')
@@ -357,218 +655,215 @@ def start_recognition(data, callback=None):
     # Now they should be strings
     print(f"Using intake={intake}, course={course}")
 
-    # Load embeddings for faster matching - pass strings
-    load_embeddings_for_courses(intake, course)
+    # Use the cached gallery for this course - only reloaded if its store changed
+    session['gallery'] = gallery_cache.get(intake, course)
 
-    print(f"Recognition started with {len(loaded_embeddings)} loaded embeddings")
+    print(f"Recognition started with {len(session['gallery'])} loaded embeddings")
+
+    # Presence is kept server-side; passing the previous id back resumes it after a reconnect
+    session['attendance'] = SessionAttendance(intake, course, data.get('attendance_session'))
+    response = {'status': 'success', 'message': 'Recognition started',
+                'attendance_session': session['attendance'].session_id}
 
     if callback:
-        callback({'status': 'success', 'message': 'Recognition started'})
+        callback(response)
 
-    return {'status': 'success', 'message': 'Recognition started'}
+    return response
 
 
-# In the process_frame function in app.py
 @socketio.on('process_frame')
 def process_frame(data):
+    sid = request.sid
+    scheduler = frame_schedulers.setdefault(sid, FrameScheduler())
+    frames_received.inc()
+
+    # Only the newest frame waits while another one is processed; older ones are dropped
+    dropped, should_process = scheduler.offer(data)
+    if dropped is not None:
+        frames_dropped.inc('stale')
+        socketio.emit('frame_processed', {
+            'timestamp': dropped.get('timestamp', 0),
+            'dropped': True,
+            'target_fps': scheduler.target_fps
+        }, to=sid)
+    if not should_process:
+        return
+
+    while True:
+        frame = scheduler.next()
+        if frame is None:
+            break
+
+        started = time.time()
+        try:
+            handle_frame(sid, frame)
+        except Exception as e:
+            print(f"❌ Frame processing error: {e}")
+        scheduler.record(time.time() - started)
+        stage_seconds.observe('total', time.time() - started)
+
+        # Acknowledge only the sending client, advertising the rate we can sustain
+        socketio.emit('frame_processed', {
+            'timestamp': frame.get('timestamp', 0),
+            'dropped': False,
+            'processing_time': time.time() - started,
+            'target_fps': scheduler.target_fps
+        }, to=sid)
+
+
+def handle_frame(sid, data):
     # Track processing time
     start_time = time.time()
     client_timestamp = data.get('timestamp', 0)
+    session = sessions.get(sid)
 
     try:
-        # Extract image data
-        img_data = data['image'].split(',')[1]
-        img_bytes = base64.b64decode(img_data)
-        nparr = np.frombuffer(img_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        # Extract image data - a binary JPEG attachment or a legacy base64 data URL
+        with stage_seconds.time('decode'):
+            img = decode_image(data['image'])
 
         if img is None or img.size == 0:
             print("❌ Image is empty or invalid")
-            socketio.emit('frame_processed')
             return
 
-        # Fast face detection with minimal parameters
+        matcher = session['gallery'] if session else active_gallery()
+        recent_recognitions = session['recent_recognitions'] if session else {}
+        aggregate = bool(session and session['aggregate'])
+        queue_wait = 0.0
+
+        def emit_detected(sorted_faces):
+            # Emit all detected faces for debugging
+            for i, face in enumerate(sorted_faces):
+                socketio.emit('face_detected', {
+                    'index': i,
+                    'box': face['box'],
+                    'confidence': float(face['confidence'])
+                }, to=sid)
+
+        def embed(crops):
+            # Embed the crops of this frame together with other clients' crops
+            nonlocal queue_wait
+            embeddings, queue_wait = inference_scheduler.submit(crops)
+            debug(f"✅ Successfully generated embeddings for {len(crops)} faces "
+                  f"(queued {queue_wait * 1000:.0f}ms)")
+            return embeddings
+
+        now = time.time()
         try:
-            results = detector.detect_faces(img)
-            print(f"👁️ Detected {len(results)} faces in frame")
-        except Exception as e:
-            print(f"❌ Face detection error: {e}")
-            socketio.emit('frame_processed')
+            faces = recognition.recognise_frame(
+                img, lambda frame: detect_faces(frame, session['detector'] if session else None), embed, matcher,
+                tracker=session['tracker'] if session else None, aggregate=aggregate, now=now,
+                timed=stage_seconds.time, on_detected=emit_detected)
+        except recognition.EmbeddingFailed as e:
+            if isinstance(e.__cause__, SchedulerBusyError):
+                frames_dropped.inc('busy')
+                debug(f"⏭️ Dropping frame: {e}")
+                return
+            print(f"❌ Failed to generate embeddings: {e}")
+            # Still emit these faces for visualization
+            for box in e.boxes:
+                socketio.emit('unrecognized_face', {
+                    'box': box,
+                    'error': str(e)
+                }, to=sid)
+            return
+
+        if not faces:
+            debug("ℹ️ No faces successfully processed to recognition stage")
             return
 
-        if not results:
-            print("⚠️ No faces detected in this frame")
-            socketio.emit('frame_processed')
+        if not len(matcher):
+            debug("⚠️ No embeddings loaded - cannot recognize faces")
+            for face in faces:
+                socketio.emit('unrecognized_face', {
+                    'box': face['box'],
+                    'error': 'No embeddings loaded'
+                }, to=sid)
             return
 
         # Process faces at various distances
         faces_processed = False
 
-        # Sort faces by size (area), largest first
-        sorted_faces = sorted(results, key=lambda x: x['box'][2] * x['box'][3], reverse=True)
-
-        # Emit all detected faces for debugging
-        for i, face in enumerate(sorted_faces):
-            socketio.emit('face_detected', {
-                'index': i,
-                'box': face['box'],
-                'confidence': float(face['confidence'])
-            })
-
-        # Process up to 3 largest faces for efficiency
-        for i, face in enumerate(sorted_faces[:3]):
-            x, y, w, h = face["box"]
-            confidence = face["confidence"]
-            print(f"🔍 Processing face #{i + 1}: Size {w}x{h}, Confidence: {confidence:.2f}")
-
-            # Skip extremely small faces (probably too far)
-            if w < 15 or h < 15:
-                print(f"⏭️ Skipping face #{i + 1}: Too small ({w}x{h})")
-                continue
-
-            # Adjust padding based on face size
-            padding_factor = 0.05  # Default padding
-            if w > 100:  # Close face
-                padding_factor = 0.02  # Less padding needed for large faces
-            elif w < 30:  # Far face
-                padding_factor = 0.1  # More padding for small faces
-
-            padding_x = int(w * padding_factor)
-            padding_y = int(h * padding_factor)
-
+        emit_started = time.perf_counter()
+        for face in faces:
+            i, box = face['index'], face['box']
+            best_match = face['name']
+            best_similarity = face['similarity']
+            threshold = face['threshold']
             try:
-                # Ensure coordinates are within bounds
-                x_start = max(0, x - padding_x)
-                y_start = max(0, y - padding_y)
-                x_end = min(img.shape[1], x + w + padding_x)
-                y_end = min(img.shape[0], y + h + padding_y)
-
-                face_img = img[y_start:y_end, x_start:x_end]
-
-                # Skip tiny crops that might cause errors
-                if face_img.shape[0] < 10 or face_img.shape[1] < 10:
-                    print(f"⏭️ Skipping face #{i + 1}: Cropped size too small")
-                    continue
-
-                # Pre-resize the image to exactly what ArcFace needs to avoid extra processing
-                resized_face = cv2.resize(face_img, (112, 112))
-
-                # Get embedding with optimized settings
-                try:
-                    embedding_result = DeepFace.represent(
-                        resized_face,
-                        model_name='ArcFace',
-                        enforce_detection=False,
-                        detector_backend='skip'  # Skip detection since we already did it
-                    )
-                    print(f"✅ Successfully generated embedding for face #{i + 1}")
-                except Exception as e:
-                    print(f"❌ Failed to generate embedding for face #{i + 1}: {e}")
-                    # Still emit this face for visualization
-                    socketio.emit('unrecognized_face', {
-                        'box': [x, y, w, h],
-                        'error': str(e)
-                    })
-                    continue
-
-                if not embedding_result:
-                    print(f"⚠️ Empty embedding result for face #{i + 1}")
+                if face['embedded']:
+                    debug(f"🔍 Face #{i + 1} - Best match: {best_match}, Similarity: {best_similarity:.4f}")
+                else:
+                    debug(f"🔁 Face #{i + 1} - Tracked as {best_match} ({best_similarity:.4f})")
+
+                # Only fresh embeddings count as votes; a tracked face adds no new evidence
+                if face['embedded'] and best_similarity > threshold and session and session['attendance']:
+                    session['attendance'].observe(best_match, now)
+
+                if best_similarity <= threshold:
+                    debug(
+                        f"⚠️ Face #{i + 1} - Best match below threshold: {best_match} ({best_similarity:.4f} < {threshold})")
+                    socketio.emit('below_threshold_match', {
+                        'name': best_match,
+                        'similarity': float(best_similarity),
+                        'threshold': threshold,
+                        'box': box
+                    }, to=sid)
                     continue
 
-                emb = embedding_result[0]['embedding']
-
-                # Find best match using vectorized operations for speed
-                if loaded_embeddings:
-                    # Get all embeddings as a matrix for fast comparison
-                    names = list(loaded_embeddings.keys())
-                    embeddings_matrix = np.array([loaded_embeddings[name] for name in names])
-
-                    # Compute similarities in one go
-                    emb_normalized = emb / np.linalg.norm(emb)
-                    similarities = np.dot(embeddings_matrix, emb_normalized)
-
-                    # Find best match
-                    best_idx = np.argmax(similarities)
-                    best_similarity = similarities[best_idx]
-                    best_match = names[best_idx]
-
-                    print(f"🔍 Face #{i + 1} - Best match: {best_match}, Similarity: {best_similarity:.4f}")
-
-                    # Adjust threshold based on face size
-                    # Smaller faces (further away) may need a lower threshold
-                    threshold = 0.75
-                    if w < 30:  # Far faces
-                        threshold = 0.72
-
-
-                    if best_similarity <= threshold:
-                        print(
-                            f"⚠️ Face #{i + 1} - Best match below threshold: {best_match} ({best_similarity:.4f} < {threshold})")
-                        socketio.emit('below_threshold_match', {
-                            'name': best_match,
-                            'similarity': float(best_similarity),
-                            'threshold': threshold,
-                            'box': [x, y, w, h]
-                        })
+                # Check if we just recognized this person to avoid duplicates
+                current_time = time.time()
+                if best_match in recent_recognitions:
+                    # Only re-emit if it's been at least 1 second
+                    if current_time - recent_recognitions[best_match] < 1.0:
                         continue
 
-                    # Set a stricter threshold for more accurate recognition
-                    if best_similarity > threshold:
-                        # Check if we just recognized this person to avoid duplicates
-                        current_time = time.time()
-                        if best_match in recent_recognitions:
-                            # Only re-emit if it's been at least 1 second
-                            if current_time - recent_recognitions[best_match] < 1.0:
-                                continue
-
-                        # Update recognition time
-                        recent_recognitions[best_match] = current_time
-                        faces_processed = True
-
-                        # Emit recognition event
-                        socketio.emit('recognition_event', {
-                            'type': 'recognition',
-                            'name': best_match,
-                            'similarity': float(best_similarity),
-                            'box': [x, y, w, h],
-                            'processing_time': time.time() - start_time,
-                            'latency': time.time() - (client_timestamp / 1000)
-                        })
-
-                        # Log performance metrics
-                        print(f"✅ Recognition: {best_match} ({best_similarity:.2f}) - "
-                              f"Processing: {(time.time() - start_time) * 1000:.0f}ms, "
-                              f"Latency: {(time.time() - (client_timestamp / 1000)) * 1000:.0f}ms")
-                else:
-                    print("⚠️ No embeddings loaded - cannot recognize faces")
-                    socketio.emit('unrecognized_face', {
-                        'box': [x, y, w, h],
-                        'error': 'No embeddings loaded'
-                    })
+                # Update recognition time
+                recent_recognitions[best_match] = current_time
+                faces_processed = True
+                faces_recognised.inc()
+
+                # Emit recognition event
+                socketio.emit('recognition_event', {
+                    'type': 'recognition',
+                    'name': best_match,
+                    'similarity': float(best_similarity),
+                    'box': box,
+                    'processing_time': time.time() - start_time,
+                    'latency': time.time() - (client_timestamp / 1000),
+                    'queue_wait': queue_wait
+                }, to=sid)
+
+                # Log performance metrics
+                debug(f"✅ Recognition: {best_match} ({best_similarity:.2f}) - "
+                      f"Processing: {(time.time() - start_time) * 1000:.0f}ms, "
+                      f"Latency: {(time.time() - (client_timestamp / 1000)) * 1000:.0f}ms")
 
             except Exception as e:
                 print(f"❌ Recognition error for face #{i + 1}: {e}")
                 socketio.emit('unrecognized_face', {
-                    'box': [x, y, w, h],
+                    'box': box,
                     'error': str(e)
-                })
+                }, to=sid)
                 continue
+        stage_seconds.observe('emit', time.perf_counter() - emit_started)
 
         if not faces_processed:
-            print("ℹ️ No faces successfully processed to recognition stage")
+            debug("ℹ️ No faces successfully processed to recognition stage")
 
     except Exception as e:
         print(f"❌ Frame processing error: {e}")
 
-    # Always emit frame_processed to unblock client
-    socketio.emit('frame_processed')
-
 
 @socketio.on('stop_recognition')
 def stop_recognition():
     # Clear recognition cache when stopping
-    global recent_recognitions
-    recent_recognitions = {}
+    session = sessions.get(request.sid)
+    if session:
+        session['recent_recognitions'] = {}
+        session['tracker'] = FaceTracker()
+        if session['attendance']:
+            session['attendance'].flush()
     return {'status': 'success', 'message': 'Recognition stopped'}
 
 
@@ -576,146 +871,126 @@ def stop_recognition():
 @app.route('/save_attendance', methods=['POST'])
 def save_attendance():
     data = request.get_json()
-    intake = data['intake']
-    course = data['course']
-    subject = data['subject']
-    attendance_list = data['attendanceList']
-    today = date.today().strftime('%d-%m-%Y')
 
-    folder_path = f"../Students/{intake}/{course}/attendence"
-    os.makedirs(folder_path, exist_ok=True)
+    # A recognition session's presence is already on the server; only the subject is needed
+    if data.get('sessionId'):
+        return save_session_attendance(data['sessionId'], data['subject'])
 
-    file_name = f"{intake} {course} {subject} attendence.xlsx"
-    file_path = os.path.join(folder_path, file_name)
+    # Several sessions or subjects can be saved at once as {"sessions": [...]}
+    batch = []
+    for entry in data.get('sessions', [data]):
+        # Convert list of students into a dict keyed by ID for easier update
+        present_ids = {str(student['id']): student['name'] for student in entry['attendanceList']}
+        batch.append((entry['intake'], entry['course'], entry['subject'],
+                      entry.get('date') or date.today(), present_ids))
 
-    # Convert list of students into a dict keyed by ID for easier update
-    present_ids = {student['id']: student['name'] for student in attendance_list}
+    try:
+        attendance_store.record_sessions(batch)
+    except ValueError as e:
+        return jsonify({"message": f"Invalid attendance date: {str(e)}"}), 400
+    catalog.invalidate()
 
-    if os.path.exists(file_path):
-        df = pd.read_excel(file_path)
-    else:
-        df = pd.DataFrame(columns=["StudentID", "Name"])
+    return jsonify({"message": "Attendance saved successfully!", "sessions": len(batch)})
 
-    # Ensure 'StudentID' is string
-    df['StudentID'] = df['StudentID'].astype(str)
 
-    # Mark attendance
-    for index, row in df.iterrows():
-        student_id = str(row['StudentID'])
-        df.at[index, today] = '✅' if student_id in present_ids else '❌'
+def save_session_attendance(session_id, subject):
+    for session in list(sessions.values()):
+        if session['attendance'] and session['attendance'].session_id == session_id:
+            session['attendance'].flush()
 
-    # Add new students if not already in the sheet
-    for student_id, name in present_ids.items():
-        if not (df['StudentID'] == student_id).any():
-            new_row = {
-                "StudentID": student_id,
-                "Name": name,
-                today: '✅'
-            }
-            df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
+    present = attendance_store.commit_session(session_id, subject, ATTENDANCE_MIN_VOTES)
+    if present is None:
+        return jsonify({"message": "Unknown attendance session"}), 404
+    catalog.invalidate()
+    return jsonify({"message": "Attendance saved successfully!", "present": present})
 
-    df.to_excel(file_path, index=False)
-    return jsonify({"message": "Attendance saved successfully!"})
 
+@app.route('/api/attendance/session/<session_id>', methods=['GET'])
+def get_session_attendance(session_id):
+    for session in list(sessions.values()):
+        if session['attendance'] and session['attendance'].session_id == session_id:
+            session['attendance'].flush()
 
-# Add this route to your Flask backend (app.js)
+    intake, course, _, present = attendance_store.session_presence(session_id, ATTENDANCE_MIN_VOTES)
+    if intake is None:
+        return jsonify({"message": "Unknown attendance session"}), 404
+    return jsonify({"intake": intake, "course": course, "students": present})
 
-@app.route('/api/attendance/student/<student_id>', methods=['GET'])
-def get_student_attendance(student_id):
+
+@app.route('/api/attendance/export', methods=['GET'])
+def export_attendance():
     intake = request.args.get('intake')
     course = request.args.get('course')
+    subject = request.args.get('subject')
 
     if not intake or not course:
         return jsonify({"error": "Both intake and course are required"}), 400
 
-    folder_path = f"../Students/{intake}/{course}/attendence"
-
-    # Check if folder exists
-    if not os.path.exists(folder_path):
-        return jsonify({"error": f"No data found for {intake} {course}"}), 404
-
-    # Get all attendance Excel files for this intake and course
-    attendance_files = [f for f in os.listdir(folder_path) if f.endswith('.xlsx') and 'attendence' in f]
-
-    if not attendance_files:
+    if not attendance_store.subjects(intake, course):
         return jsonify({"error": "No attendance records found"}), 404
 
-    student_name = ""
-    subjects_data = []
+    workbook = attendance_store.export_workbook(intake, course, subject)
+    file_name = f"{intake} {course} {subject} attendence.xlsx" if subject else f"{intake} {course} attendence.xlsx"
+    return send_file(workbook, as_attachment=True, download_name=file_name,
+                     mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
 
-    # Process each attendance file (representing a subject)
-    for file_name in attendance_files:
-        file_path = os.path.join(folder_path, file_name)
 
-        # Extract subject name from file name
-        # Format: "intake course subject attendence.xlsx"
-        parts = file_name.split(" ")
-        if len(parts) < 3:
-            continue  # Skip if filename format doesn't match expected pattern
-
-        # Extract subject name (all parts except intake, course, and "attendence.xlsx")
-        subject_name = " ".join(parts[2:-1])  # Skip intake, course, and "attendence.xlsx"
+@app.route('/api/roster/export', methods=['GET'])
+def export_roster():
+    intake = request.args.get('intake')
+    course = request.args.get('course')
 
-        try:
-            df = pd.read_excel(file_path)
+    if not intake or not course:
+        return jsonify({"error": "Both intake and course are required"}), 400
 
-            # Ensure 'StudentID' is string
-            df['StudentID'] = df['StudentID'].astype(str)
+    return send_file(roster_store.export_workbook(intake, course), as_attachment=True,
+                     download_name=f"{intake} {course}.xlsx",
+                     mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
 
-            # Find the student in the Excel file
-            student_row = df[df['StudentID'] == student_id]
 
-            if student_row.empty:
-                # Student not found in this subject
-                subjects_data.append({
-                    "name": subject_name,
-                    "percentage": 0
-                })
-                continue
+@app.route('/api/attendance/student/<student_id>', methods=['GET'])
+def get_student_attendance(student_id):
+    intake = request.args.get('intake')
+    course = request.args.get('course')
 
-            # Get student name if not already set
-            if not student_name and 'Name' in student_row.columns:
-                student_name = student_row['Name'].iloc[0]
+    if not intake or not course:
+        return jsonify({"error": "Both intake and course are required"}), 400
 
-            # Calculate attendance percentage
-            date_columns = [col for col in df.columns if col not in ['StudentID', 'Name']]
+    student_name, subjects_data = attendance_store.student_summary(intake, course, student_id)
+    if not subjects_data:
+        return jsonify({"error": "No attendance records found"}), 404
 
-            if not date_columns:
-                subjects_data.append({
-                    "name": subject_name,
-                    "percentage": 0
-                })
-                continue
+    return jsonify({
+        "name": student_name,
+        "subjects": subjects_data
+    })
 
-            present_count = 0
-            for date_col in date_columns:
-                if student_row[date_col].iloc[0] == '✅':
-                    present_count += 1
 
-            attendance_percentage = (present_count / len(date_columns)) * 100
+@app.route('/api/attendance/students', methods=['GET'])
+def get_students_attendance():
+    intake = request.args.get('intake')
+    course = request.args.get('course')
+    # ?ids=1,2,3 or ?ids=1&ids=2
+    student_ids = [i.strip() for ids in request.args.getlist('ids') for i in ids.split(',') if i.strip()]
 
-            subjects_data.append({
-                "name": subject_name,
-                "percentage": attendance_percentage
-            })
+    if not intake or not course or not student_ids:
+        return jsonify({"error": "intake, course and ids are required"}), 400
 
-        except Exception as e:
-            print(f"Error processing {file_name}: {str(e)}")
-            # Continue with other files even if one fails
+    summaries = attendance_store.students_summary(intake, course, student_ids)
+    if not any(subjects for _, subjects in summaries.values()):
+        return jsonify({"error": "No attendance records found"}), 404
 
-    return jsonify({
-        "name": student_name,
-        "subjects": subjects_data
-    })
+    return jsonify({"students": [
+        {"id": student_id, "name": name, "subjects": subjects}
+        for student_id, (name, subjects) in summaries.items()
+    ]})
 
 
 @app.route('/api/intakes', methods=['GET'])
 def get_intakes():
     # Return the list of intakes based on folder structure
     try:
-        base_dir = "../Students"
-        intakes = [folder for folder in os.listdir(base_dir) if os.path.isdir(os.path.join(base_dir, folder))]
-        return jsonify(intakes)
+        return jsonify(catalog.intakes())
     except Exception as e:
         print(f"Error getting intakes: {str(e)}")
         return jsonify([])
@@ -728,112 +1003,57 @@ def get_courses():
         return jsonify({"error": "Intake parameter is required"}), 400
 
     try:
-        base_dir = f"../Students/{intake}"
-        if not os.path.exists(base_dir):
-            return jsonify([])
-
-        courses = [folder for folder in os.listdir(base_dir) if os.path.isdir(os.path.join(base_dir, folder))]
-        return jsonify(courses)
+        return jsonify(catalog.courses(intake))
     except Exception as e:
         print(f"Error getting courses: {str(e)}")
         return jsonify([])
 
 
-@app.route('/api/attendance/intake/<intake>/course/<course>', methods=['GET'])
-def get_intake_attendance(intake, course):
-    folder_path = f"../Students/{intake}/{course}/attendence"
-
-    # Check if folder exists
-    if not os.path.exists(folder_path):
-        return jsonify({"error": f"No data found for {intake} {course}"}), 404
+@app.route('/api/catalog', methods=['GET'])
+def get_catalog():
+    # The whole intake -> course -> subjects tree in one response
+    try:
+        return jsonify(catalog.tree())
+    except Exception as e:
+        print(f"Error getting catalog: {str(e)}")
+        return jsonify({})
 
-    # Get all attendance Excel files for this intake and course
-    attendance_files = [f for f in os.listdir(folder_path) if f.endswith('.xlsx') and 'attendence' in f]
 
-    if not attendance_files:
+@app.route('/api/attendance/intake/<intake>/course/<course>', methods=['GET'])
+def get_intake_attendance(intake, course):
+    version = attendance_store.course_version(intake, course)
+    if version is None:
         return jsonify({"error": "No attendance records found"}), 404
 
-    # Dictionary to store student attendance data by subject
-    students_data = {}
-
-    # Dictionary to store daily attendance counts for graph
-    graph_data = {}
-
-    # Process each attendance file (representing a subject)
-    for file_name in attendance_files:
-        file_path = os.path.join(folder_path, file_name)
-
-        # Extract subject name from file name
-        parts = file_name.split(" ")
-        if len(parts) < 3:
-            continue
-
-        subject_name = " ".join(parts[2:-1])
-
-        try:
-            df = pd.read_excel(file_path)
-
-            # Ensure 'StudentID' is string
-            df['StudentID'] = df['StudentID'].astype(str)
-
-            # Get date columns (all columns except 'StudentID' and 'Name')
-            date_columns = [col for col in df.columns if col not in ['StudentID', 'Name']]
-
-            # Process each student's attendance for this subject
-            for _, row in df.iterrows():
-                student_id = row['StudentID']
-                student_name = row['Name'] if 'Name' in row else "Unknown"
-
-                # Initialize student record if not exists
-                if student_id not in students_data:
-                    students_data[student_id] = {
-                        "id": student_id,
-                        "name": student_name,
-                        "subjects": {}
-                    }
-
-                # Calculate attendance percentage for this subject
-                present_count = 0
-                for date_col in date_columns:
-                    if row[date_col] == '✅':
-                        present_count += 1
-
-                        # Update graph data for this date and subject
-                        if date_col not in graph_data:
-                            graph_data[date_col] = {}
-
-                        if subject_name not in graph_data[date_col]:
-                            graph_data[date_col][subject_name] = 0
-
-                        graph_data[date_col][subject_name] += 1
-
-                attendance_percentage = (present_count / len(date_columns)) * 100 if date_columns else 0
-                students_data[student_id]["subjects"][subject_name] = attendance_percentage
-
-        except Exception as e:
-            print(f"Error processing {file_name}: {str(e)}")
-
-    # Format graph data for charting
-    formatted_graph_data = []
-    for date, subjects in graph_data.items():
-        date_entry = {"date": date}
-        date_entry.update(subjects)
-        formatted_graph_data.append(date_entry)
-
-    # Sort graph data by date
-    formatted_graph_data.sort(key=lambda x: x["date"])
-
-    return jsonify({
-        "studentsData": list(students_data.values()),
-        "graphData": formatted_graph_data
-    })
+    def build():
+        students_data, graph_data = attendance_store.course_summary(intake, course)
+        return {
+            "studentsData": students_data,
+            "graphData": graph_data
+        }
 
+    return cached_response(('intake', intake, course), version, build)
 
 
+def cached_response(key, version, build):
+    """Serve build()'s JSON from memory until version changes, answering If-None-Match with 304"""
+    entry = analytics_cache.get(key)
+    if entry is None or entry[0] != version:
+        entry = (version, json.dumps(build()))
+        analytics_cache[key] = entry
 
+    response = app.response_class(entry[1], mimetype='application/json')
+    # Hashed so quotes or non-latin-1 intake and course names cannot break the header
+    response.set_etag(hashlib.sha1(json.dumps([key, version]).encode('utf-8')).hexdigest())
+    # Let browsers keep the body but check back every time
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
 
 
 if __name__ == '__main__':
+    # Warm the models in the background so HTTP-only endpoints are served meanwhile
+    socketio.start_background_task(warm_up_models)
+
     # For development with socketio
     socketio.run(app, host='0.0.0.0', port=5000, debug=True)
 
@@ -0,0 +1,479 @@
+import io
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
+
+# One database for every intake, course and subject
+ATTENDANCE_DB_PATH = os.environ.get('ATTENDANCE_DB_PATH', os.path.join('..', 'Students', 'attendance.db'))
+# Root of the legacy "<intake> <course> <subject> attendence.xlsx" sheets
+SHEETS_BASE_DIR = os.path.join('..', 'Students')
+
+# Presence of sessions that were never saved is dropped after this many days
+SESSION_RETENTION_DAYS = int(os.environ.get('SESSION_PRESENCE_RETENTION_DAYS', 7))
+
+# Dates are stored as ISO strings so they sort, and shown the way the sheets wrote them
+SHEET_DATE_FORMAT = '%d-%m-%Y'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS students (
+    intake TEXT NOT NULL,
+    course TEXT NOT NULL,
+    studentid TEXT NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (intake, course, studentid)
+);
+CREATE TABLE IF NOT EXISTS attendance (
+    intake TEXT NOT NULL,
+    course TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    day TEXT NOT NULL,
+    studentid TEXT NOT NULL,
+    present INTEGER NOT NULL,
+    PRIMARY KEY (intake, course, subject, day, studentid)
+);
+CREATE INDEX IF NOT EXISTS attendance_student ON attendance (studentid, intake, course);
+
+-- Aggregates kept up to date by every write, so the dashboards never scan attendance
+CREATE TABLE IF NOT EXISTS subject_days (
+    intake TEXT NOT NULL,
+    course TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    day TEXT NOT NULL,
+    present_count INTEGER NOT NULL,
+    PRIMARY KEY (intake, course, subject, day)
+);
+CREATE TABLE IF NOT EXISTS student_totals (
+    intake TEXT NOT NULL,
+    course TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    studentid TEXT NOT NULL,
+    present_days INTEGER NOT NULL,
+    PRIMARY KEY (intake, course, subject, studentid)
+);
+CREATE INDEX IF NOT EXISTS student_totals_student ON student_totals (studentid, intake, course);
+-- Students seen by a live recognition session, before a subject is chosen and saved
+CREATE TABLE IF NOT EXISTS session_presence (
+    session_id TEXT NOT NULL,
+    intake TEXT NOT NULL,
+    course TEXT NOT NULL,
+    day TEXT NOT NULL,
+    studentid TEXT NOT NULL,
+    name TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    votes INTEGER NOT NULL,
+    PRIMARY KEY (session_id, studentid)
+);
+-- Bumped on every change to a course, used to validate cached dashboard responses
+CREATE TABLE IF NOT EXISTS course_versions (
+    intake TEXT NOT NULL,
+    course TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    PRIMARY KEY (intake, course)
+);
+"""
+
+# One connection per process: under eventlet every request and event is a greenlet on the same
+# OS thread, so a per-thread connection would be opened again for each of them
+_conn = None
+# Held for every write transaction so one caller's statements never land inside another's
+_lock = threading.RLock()
+# (intake, course) -> student_index() result, replaced when the course version moves on
+_student_indexes = {}
+
+
+def connect():
+    """Return the shared connection, creating the schema on first use"""
+    global _conn
+    if _conn is not None:
+        return _conn
+
+    with _lock:
+        if _conn is not None:
+            return _conn
+        os.makedirs(os.path.dirname(ATTENDANCE_DB_PATH) or '.', exist_ok=True)
+        is_new = not os.path.exists(ATTENDANCE_DB_PATH)
+        conn = sqlite3.connect(ATTENDANCE_DB_PATH, timeout=30, check_same_thread=False)
+        # WAL lets dashboards read while attendance is being written
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(SCHEMA)
+        # Databases created before the aggregate tables existed
+        if conn.execute("SELECT NOT EXISTS (SELECT 1 FROM course_versions) "
+                        "AND EXISTS (SELECT 1 FROM attendance)").fetchone()[0]:
+            rebuild_aggregates(conn)
+        _conn = conn
+
+        if is_new:
+            imported = import_sheets(SHEETS_BASE_DIR)
+            if imported:
+                print(f"Imported {imported} attendance records from Excel sheets")
+    return conn
+
+
+def data_version():
+    """Changes whenever another connection (bulk_enroll.py, another server) commits to the database"""
+    return connect().execute('PRAGMA data_version').fetchone()[0]
+
+
+@contextmanager
+def transaction():
+    """Commit (or roll back) the statements run inside, holding the connection's lock"""
+    conn = connect()
+    with _lock, conn:
+        yield conn
+
+
+def to_iso(day):
+    """Accept a date, an ISO string or a sheet-style dd-mm-YYYY string"""
+    if isinstance(day, str):
+        try:
+            return date.fromisoformat(day).isoformat()
+        except ValueError:
+            return datetime.strptime(day, SHEET_DATE_FORMAT).date().isoformat()
+    return day.isoformat()
+
+
+def to_sheet_date(iso_day):
+    return datetime.strptime(iso_day, '%Y-%m-%d').strftime(SHEET_DATE_FORMAT)
+
+
+def record_session(intake, course, subject, day, present):
+    """Mark everyone in present ({studentid: name}) present for the day, everyone else known to the subject absent"""
+    record_sessions([(intake, course, subject, day, present)])
+
+
+def record_sessions(sessions):
+    """Save several (intake, course, subject, day, present) sessions in one transaction"""
+    with transaction() as conn:
+        for intake, course, subject, day, present in sessions:
+            day = to_iso(day)
+            conn.executemany(
+                "INSERT INTO students (intake, course, studentid, name) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (intake, course, studentid) DO NOTHING",
+                [(intake, course, str(studentid), name) for studentid, name in present.items()]
+            )
+            before = _day_marks(conn, intake, course, subject, day)
+            # Everyone the subject has seen starts the day absent, in one statement
+            conn.execute(
+                "INSERT OR REPLACE INTO attendance (intake, course, subject, day, studentid, present) "
+                "SELECT intake, course, subject, ?, studentid, 0 FROM student_totals "
+                "WHERE intake = ? AND course = ? AND subject = ?",
+                (day, intake, course, subject)
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO attendance (intake, course, subject, day, studentid, present) "
+                "VALUES (?, ?, ?, ?, ?, 1)",
+                [(intake, course, subject, day, str(studentid)) for studentid in present]
+            )
+            _update_aggregates(conn, intake, course, subject, day, before)
+
+
+def _day_marks(conn, intake, course, subject, day):
+    return dict(conn.execute(
+        "SELECT studentid, present FROM attendance WHERE intake = ? AND course = ? AND subject = ? AND day = ?",
+        (intake, course, subject, day)
+    ).fetchall())
+
+
+def _update_aggregates(conn, intake, course, subject, day, before):
+    """Move the aggregates by the difference between a day's marks before and after a save"""
+    after = _day_marks(conn, intake, course, subject, day)
+    conn.execute(
+        "INSERT OR REPLACE INTO subject_days (intake, course, subject, day, present_count) VALUES (?, ?, ?, ?, ?)",
+        (intake, course, subject, day, sum(after.values()))
+    )
+    conn.executemany(
+        "INSERT INTO student_totals (intake, course, subject, studentid, present_days) VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT (intake, course, subject, studentid) DO UPDATE SET "
+        "present_days = present_days + excluded.present_days",
+        [(intake, course, subject, studentid, present - before.get(studentid, 0))
+         for studentid, present in after.items()]
+    )
+    conn.execute(
+        "INSERT INTO course_versions (intake, course, version) VALUES (?, ?, 1) "
+        "ON CONFLICT (intake, course) DO UPDATE SET version = version + 1", (intake, course)
+    )
+
+
+def _refresh_aggregates(conn, intake, course, subject):
+    """Recompute the aggregates of one subject from all of its attendance"""
+    conn.execute(
+        "INSERT OR REPLACE INTO subject_days (intake, course, subject, day, present_count) "
+        "SELECT intake, course, subject, day, SUM(present) FROM attendance "
+        "WHERE intake = ? AND course = ? AND subject = ? GROUP BY day", (intake, course, subject)
+    )
+    conn.execute(
+        "INSERT OR REPLACE INTO student_totals (intake, course, subject, studentid, present_days) "
+        "SELECT intake, course, subject, studentid, SUM(present) FROM attendance "
+        "WHERE intake = ? AND course = ? AND subject = ? GROUP BY studentid", (intake, course, subject)
+    )
+    conn.execute(
+        "INSERT INTO course_versions (intake, course, version) VALUES (?, ?, 1) "
+        "ON CONFLICT (intake, course) DO UPDATE SET version = version + 1", (intake, course)
+    )
+
+
+def rebuild_aggregates(conn=None):
+    """Recompute every aggregate from the attendance table"""
+    conn = conn or connect()
+    with _lock, conn:
+        for intake, course, subject in conn.execute(
+                "SELECT DISTINCT intake, course, subject FROM attendance").fetchall():
+            _refresh_aggregates(conn, intake, course, subject)
+
+
+def course_version(intake, course):
+    """Change counter of a course's attendance, or None if it has none"""
+    row = connect().execute(
+        "SELECT version FROM course_versions WHERE intake = ? AND course = ?", (intake, course)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def add_presence(session_id, intake, course, day, seen):
+    """Merge {studentid: (name, first_seen, last_seen, votes)} deltas into a session's presence rows"""
+    day = to_iso(day)
+    with transaction() as conn:
+        conn.executemany(
+            "INSERT INTO session_presence (session_id, intake, course, day, studentid, name, first_seen, last_seen, votes) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (session_id, studentid) DO UPDATE SET "
+            "first_seen = MIN(first_seen, excluded.first_seen), last_seen = MAX(last_seen, excluded.last_seen), "
+            "votes = votes + excluded.votes",
+            [(session_id, intake, course, day, studentid, name, first, last, votes)
+             for studentid, (name, first, last, votes) in seen.items()]
+        )
+
+
+def session_presence(session_id, min_votes=1):
+    """Return (intake, course, day, [{"id", "name", "first_seen", "last_seen", "votes"}]) for a session"""
+    rows = connect().execute(
+        "SELECT intake, course, day, studentid, name, first_seen, last_seen, votes FROM session_presence "
+        "WHERE session_id = ? ORDER BY first_seen", (session_id,)
+    ).fetchall()
+    if not rows:
+        return None, None, None, []
+    intake, course, day = rows[0][:3]
+    return intake, course, day, [
+        {"id": r[3], "name": r[4], "first_seen": r[5], "last_seen": r[6], "votes": r[7]}
+        for r in rows if r[7] >= min_votes
+    ]
+
+
+def commit_session(session_id, subject, min_votes=1):
+    """Save a recognition session's presence as the subject's attendance
+
+    Returns the number of students marked present, or None for an unknown session.
+    """
+    intake, course, day, present = session_presence(session_id, min_votes)
+    if intake is None:
+        return None
+    record_session(intake, course, subject, day, {p["id"]: p["name"] for p in present})
+
+    # The presence rows have served their purpose; abandoned sessions go once they are old
+    oldest = date.fromordinal(date.today().toordinal() - SESSION_RETENTION_DAYS).isoformat()
+    with transaction() as conn:
+        conn.execute("DELETE FROM session_presence WHERE session_id = ? OR day < ?", (session_id, oldest))
+    return len(present)
+
+
+def subjects(intake, course):
+    return [row[0] for row in connect().execute(
+        "SELECT DISTINCT subject FROM subject_days WHERE intake = ? AND course = ? ORDER BY subject",
+        (intake, course)
+    )]
+
+
+def all_subjects():
+    """Every (intake, course, subject) with recorded attendance"""
+    return connect().execute(
+        "SELECT DISTINCT intake, course, subject FROM subject_days ORDER BY intake, course, subject"
+    ).fetchall()
+
+
+def student_index(intake, course):
+    """Per-course lookup of every student's present days, rebuilt only when the course changes
+
+    Returns (version, {studentid: (name, {subject: present_days})}, {subject: days recorded}).
+    """
+    version = course_version(intake, course)
+    cached = _student_indexes.get((intake, course))
+    if cached is not None and cached[0] == version:
+        return cached
+
+    conn = connect()
+    students = {}
+    for studentid, name, subject, present in conn.execute(
+            "SELECT t.studentid, COALESCE(s.name, ''), t.subject, t.present_days FROM student_totals t "
+            "LEFT JOIN students s ON s.intake = t.intake AND s.course = t.course AND s.studentid = t.studentid "
+            "WHERE t.intake = ? AND t.course = ?", (intake, course)):
+        students.setdefault(studentid, (name, {}))[1][subject] = present
+    index = (version, students, _days_per_subject(conn, intake, course))
+    _student_indexes[(intake, course)] = index
+    return index
+
+
+def student_summary(intake, course, studentid):
+    """Return (name, [{"name": subject, "percentage": ...}]) across every subject of the course
+
+    A percentage is present days over all days recorded for the subject, as the sheets counted it.
+    """
+    return students_summary(intake, course, [studentid])[str(studentid)]
+
+
+def students_summary(intake, course, studentids):
+    """student_summary for many students at once, keyed by student ID"""
+    _, students, days = student_index(intake, course)
+    summaries = {}
+    for studentid in map(str, studentids):
+        name, present = students.get(studentid, ("", {}))
+        summaries[studentid] = (name, [{"name": subject, "percentage": present.get(subject, 0) / total * 100}
+                                       for subject, total in days.items()])
+    return summaries
+
+
+def course_summary(intake, course):
+    """Return (studentsData, graphData) in the shape the attendance dashboard expects"""
+    conn = connect()
+    days = _days_per_subject(conn, intake, course)
+
+    students = {}
+    for studentid, name, subject, present in conn.execute(
+            "SELECT t.studentid, COALESCE(s.name, 'Unknown'), t.subject, t.present_days FROM student_totals t "
+            "LEFT JOIN students s ON s.intake = t.intake AND s.course = t.course AND s.studentid = t.studentid "
+            "WHERE t.intake = ? AND t.course = ?", (intake, course)):
+        student = students.setdefault(studentid, {
+            "id": studentid,
+            "name": name,
+            "subjects": {}
+        })
+        student["subjects"][subject] = present / days[subject] * 100
+
+    # Days nobody attended are left out of the graph, as before
+    graph = {}
+    for day, subject, count in conn.execute(
+            "SELECT day, subject, present_count FROM subject_days "
+            "WHERE intake = ? AND course = ? AND present_count > 0 ORDER BY day", (intake, course)):
+        graph.setdefault(day, {"date": to_sheet_date(day)})[subject] = count
+
+    return list(students.values()), list(graph.values())
+
+
+def _days_per_subject(conn, intake, course):
+    return dict(conn.execute(
+        "SELECT subject, COUNT(*) FROM subject_days WHERE intake = ? AND course = ? "
+        "GROUP BY subject ORDER BY subject", (intake, course)
+    ).fetchall())
+
+
+def subject_frame(intake, course, subject):
+    """One subject in the old sheet layout: StudentID, Name and a ✅/❌ column per day"""
+    import pandas as pd
+
+    conn = connect()
+    rows = conn.execute(
+        "SELECT a.studentid, COALESCE(s.name, ''), a.day, a.present FROM attendance a "
+        "LEFT JOIN students s ON s.intake = a.intake AND s.course = a.course AND s.studentid = a.studentid "
+        "WHERE a.intake = ? AND a.course = ? AND a.subject = ?",
+        (intake, course, subject)
+    ).fetchall()
+    if not rows:
+        return pd.DataFrame(columns=["StudentID", "Name"])
+
+    df = pd.DataFrame(rows, columns=["StudentID", "Name", "Day", "Present"])
+    sheet = df.pivot_table(index=["StudentID", "Name"], columns="Day", values="Present", aggfunc='max')
+    sheet = sheet.reindex(sorted(sheet.columns), axis=1)
+    sheet = sheet.apply(lambda col: col.map({1: '✅', 0: '❌'}))
+    sheet.columns = [to_sheet_date(day) for day in sheet.columns]
+    return sheet.reset_index()
+
+
+def export_workbook(intake, course, subject=None):
+    """Write the course's attendance to an in-memory xlsx, one sheet per subject"""
+    import pandas as pd
+
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        for name in ([subject] if subject else subjects(intake, course)):
+            # Excel limits sheet names to 31 characters
+            subject_frame(intake, course, name).to_excel(writer, sheet_name=name[:31], index=False)
+    output.seek(0)
+    return output
+
+
+def import_sheets(base_dir=SHEETS_BASE_DIR):
+    """Load every legacy attendance workbook under base_dir; safe to run more than once"""
+    if not os.path.isdir(base_dir):
+        return 0
+
+    import pandas as pd
+
+    conn = connect()
+    imported = 0
+    for intake in sorted(os.listdir(base_dir)):
+        intake_path = os.path.join(base_dir, intake)
+        if not os.path.isdir(intake_path):
+            continue
+        for course in sorted(os.listdir(intake_path)):
+            folder_path = os.path.join(intake_path, course, 'attendence')
+            if not os.path.isdir(folder_path):
+                continue
+            for file_name in sorted(os.listdir(folder_path)):
+                # Format: "intake course subject attendence.xlsx"
+                parts = file_name.split(" ")
+                if not file_name.endswith('.xlsx') or 'attendence' not in file_name or len(parts) < 3:
+                    continue
+                subject = " ".join(parts[2:-1])
+
+                try:
+                    df = pd.read_excel(os.path.join(folder_path, file_name))
+                except Exception as e:
+                    print(f"Error reading {file_name}: {str(e)}")
+                    continue
+                df['StudentID'] = df['StudentID'].astype(str).str.strip()
+
+                days = {}
+                for col in df.columns:
+                    if col in ('StudentID', 'Name'):
+                        continue
+                    try:
+                        days[col] = to_iso(col if isinstance(col, str) else col.date())
+                    except (ValueError, AttributeError):
+                        print(f"Skipping column {col!r} in {file_name}: not a date")
+
+                students = []
+                records = []
+                for row in df.to_dict('records'):
+                    studentid = row['StudentID']
+                    if 'Name' in df.columns and isinstance(row['Name'], str):
+                        students.append((intake, course, studentid, row['Name']))
+                    for col, day in days.items():
+                        # Blank cells are days before the student joined the sheet
+                        mark = row.get(col)
+                        if mark in ('✅', '❌'):
+                            records.append((intake, course, subject, day, studentid, int(mark == '✅')))
+
+                with _lock, conn:
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO students (intake, course, studentid, name) VALUES (?, ?, ?, ?)",
+                        students
+                    )
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO attendance (intake, course, subject, day, studentid, present) "
+                        "VALUES (?, ?, ?, ?, ?, ?)", records
+                    )
+                    _refresh_aggregates(conn, intake, course, subject)
+                imported += len(records)
+    return imported
+
+
+if __name__ == '__main__':
+    # python attendance_store.py import [folder]
+    if len(sys.argv) < 2 or sys.argv[1] != 'import':
+        print("Usage: python attendance_store.py import [Students folder]")
+        sys.exit(1)
+    count = import_sheets(sys.argv[2] if len(sys.argv) > 2 else SHEETS_BASE_DIR)
+    print(f"Imported {count} attendance records into {ATTENDANCE_DB_PATH}")
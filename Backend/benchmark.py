@@ -0,0 +1,189 @@
+"""Replay recorded frames through the live handler's detect -> crop -> embed -> match pipeline, without a browser
+
+    python benchmark.py <frames folder> [--gallery-sizes 1000 10000 100000]
+                        [--students Students/<intake>/<course>] [--labels labels.json]
+
+Frames are JPEG/PNG files replayed in name order. The gallery for each run is the
+real enrolled faces from --students (if given) padded with random unit vectors
+up to the requested size.
+
+labels.json maps a frame file name to the gallery key expected for its largest
+face ("<name>_<studentid>"), or to null for someone who is not enrolled. With it
+the report includes true and false accept rates at 0.75, 0.72 and the live
+size-dependent rule.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+import face_detection
+import gallery_store
+import recognition
+from face_embedding import represent_batch
+from gallery import EMBEDDING_DIM, EmbeddingGallery
+
+STAGES = ('decode', 'detect', 'crop', 'embed', 'match', 'total')
+THRESHOLDS = (recognition.THRESHOLD, recognition.FAR_THRESHOLD)
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+        except Exception:
+            return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def build_gallery(size, students=None, seed=0):
+    """Real enrolled embeddings (if any) plus random unit vectors up to size rows"""
+    names, rows = [], []
+    if students:
+        store = gallery_store.open_store(students)
+        if store is not None:
+            keys, matrix, _ = store
+            names.extend(keys)
+            rows.append(np.asarray(matrix, dtype=np.float32))
+
+    synthetic = max(0, size - len(names))
+    if synthetic:
+        rng = np.random.default_rng(seed)
+        vectors = rng.standard_normal((synthetic, EMBEDDING_DIM)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        names.extend(f"synthetic_{i}" for i in range(synthetic))
+        rows.append(vectors)
+
+    gallery = EmbeddingGallery()
+    if rows:
+        gallery.attach(names, np.ascontiguousarray(np.concatenate(rows)))
+    return gallery
+
+
+def load_frames(folder):
+    files = sorted(f for f in os.listdir(folder) if f.lower().endswith(('.jpg', '.jpeg', '.png')))
+    frames = []
+    for file in files:
+        with open(os.path.join(folder, file), 'rb') as f:
+            frames.append((file, f.read()))
+    return frames
+
+
+def replay(frames, gallery, backend=None, embedding_backend=None):
+    """Run every frame through the live handler's pipeline; returns (per-stage timings, largest-face results)"""
+    timings = {stage: [] for stage in STAGES}
+    results = {}
+
+    @contextmanager
+    def timed(stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            timings[stage].append(time.perf_counter() - started)
+
+    for file, payload in frames:
+        started = time.perf_counter()
+
+        with timed('decode'):
+            img = cv2.imdecode(np.frombuffer(payload, np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            continue
+
+        faces = recognition.recognise_frame(
+            img, lambda frame: face_detection.detect_faces(frame, backend),
+            lambda crops: represent_batch(crops, backend=embedding_backend), gallery, timed=timed)
+        if faces and faces[0]['embedded']:
+            results[file] = (faces[0]['name'], faces[0]['similarity'], faces[0]['box'][2])
+
+        timings['total'].append(time.perf_counter() - started)
+    return timings, results
+
+
+def accept_rates(results, labels, threshold=None):
+    """(true accept rate over enrolled frames, false accept rate over all labelled frames)
+
+    threshold=None applies the live rule from recognition.match_threshold.
+    """
+    genuine = accepted = false_accepts = labelled = 0
+    for file, expected in labels.items():
+        if file not in results:
+            if expected is not None:
+                genuine += 1  # face missed entirely counts as a rejection
+            labelled += 1
+            continue
+        name, similarity, width = results[file]
+        labelled += 1
+        limit = threshold if threshold is not None else recognition.match_threshold(width)
+        is_accept = similarity > limit
+        if expected is not None:
+            genuine += 1
+            accepted += is_accept and name == expected
+        false_accepts += is_accept and name != expected
+    return (accepted / genuine if genuine else None,
+            false_accepts / labelled if labelled else None)
+
+
+def report(size, frames, timings, results, labels):
+    elapsed = sum(timings['total'])
+    print(f"\nGallery of {size} embeddings: {len(frames)} frames in {elapsed:.2f}s "
+          f"({len(frames) / elapsed if elapsed else 0:.1f} frames/s), {len(results)} with a face")
+    for stage in STAGES:
+        values = np.array(timings[stage]) * 1000
+        if not len(values):
+            continue
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        print(f"  {stage:7s} p50 {p50:8.2f}ms  p95 {p95:8.2f}ms  p99 {p99:8.2f}ms  (n={len(values)})")
+
+    if labels:
+        for threshold in THRESHOLDS + (None,):
+            tar, far = accept_rates(results, labels, threshold)
+            print(f"  threshold {threshold or 'by size'}: TAR {tar if tar is None else f'{tar:.3f}'}, "
+                  f"FAR {far if far is None else f'{far:.3f}'}")
+
+    rss = peak_rss_mb()
+    if rss is not None:
+        print(f"  peak RSS {rss:.0f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline recognition benchmark")
+    parser.add_argument('frames', help="folder of recorded frames")
+    parser.add_argument('--gallery-sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--students', help="Students/<intake>/<course> folder whose real embeddings are included")
+    parser.add_argument('--labels', help="JSON file mapping frame names to expected gallery keys")
+    parser.add_argument('--detector', help="detector backend (default: DETECTOR_BACKEND)")
+    parser.add_argument('--embedding', help="embedding backend: keras, onnx or tflite (default: EMBEDDING_BACKEND)")
+    args = parser.parse_args()
+
+    frames = load_frames(args.frames)
+    if not frames:
+        print(f"No frames found in {args.frames}")
+        sys.exit(1)
+
+    labels = None
+    if args.labels:
+        with open(args.labels, 'r', encoding='utf-8') as f:
+            labels = json.load(f)
+
+    # One untimed frame so model building is not counted
+    replay(frames[:1], build_gallery(1), args.detector, args.embedding)
+
+    for size in args.gallery_sizes:
+        gallery = build_gallery(size, args.students)
+        timings, results = replay(frames, gallery, args.detector, args.embedding)
+        report(len(gallery), frames, timings, results, labels)
+
+
+if __name__ == '__main__':
+    main()
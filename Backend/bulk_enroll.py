@@ -0,0 +1,202 @@
+"""Enroll whole intakes from folders of photos, without going through the web UI
+
+    python bulk_enroll.py <photos root> [--processes N] [--window N] [--force]
+
+The photos root is laid out as <intake>/<course>/<studentid>_<name>/*.jpg.
+Embeddings go to the course's gallery store under Students/ and students are
+added to the roster store, same as /register.
+Students whose photos have not changed since their last enrollment are skipped,
+so an interrupted run can simply be started again.
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date
+
+import cv2
+
+import face_detection
+import gallery_store
+import roster_store
+from face_embedding import represent_batch
+from face_pool import FacePool
+from face_quality import registration_crops, robust_mean_embedding
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+# Per-course record of which photo set each student was enrolled from
+STATE_FILE = 'enrollment.json'
+
+
+def photo_signature(files):
+    """Changes whenever a photo is added, removed or rewritten"""
+    stats = [os.stat(f) for f in files]
+    return f"{len(files)}:{max(s.st_mtime_ns for s in stats)}:{sum(s.st_size for s in stats)}"
+
+
+def read_state(folder):
+    path = os.path.join(folder, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_state(folder, state):
+    path = os.path.join(folder, STATE_FILE)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(path + '.tmp', path)
+
+
+def find_students(root):
+    """Yield (intake, course, studentid, name, image paths) for every student folder"""
+    for intake in sorted(os.listdir(root)):
+        intake_path = os.path.join(root, intake)
+        if not os.path.isdir(intake_path):
+            continue
+        for course in sorted(os.listdir(intake_path)):
+            course_path = os.path.join(intake_path, course)
+            if not os.path.isdir(course_path):
+                continue
+            for student in sorted(os.listdir(course_path)):
+                student_path = os.path.join(course_path, student)
+                studentid, _, name = student.partition('_')
+                if not os.path.isdir(student_path) or not name:
+                    continue
+                files = [os.path.join(student_path, f) for f in sorted(os.listdir(student_path))
+                         if f.lower().endswith(IMAGE_EXTENSIONS)]
+                if files:
+                    yield intake, course, studentid.strip(), name.strip(), files
+
+
+class Enroller:
+    def __init__(self, processes):
+        # Worker processes for detection and ArcFace; 0 runs everything in this process
+        self.pool = FacePool(processes) if processes > 0 else None
+        self.readers = ThreadPoolExecutor(max_workers=max(4, processes))
+
+    def detect_faces_many(self, images):
+        if self.pool is not None:
+            return self.pool.detect_faces_many(images)
+        return [face_detection.detect_faces(img) for img in images]
+
+    def embed_faces(self, crops):
+        if self.pool is not None:
+            return self.pool.represent_batch(crops)
+        return represent_batch(crops)
+
+    def student_embedding(self, files):
+        """Return (mean embedding, images used), or (None, 0) if no usable face was found"""
+        decoded = [(i, img) for i, img in enumerate(self.readers.map(cv2.imread, files))
+                   if img is not None and img.size > 0]
+        if not decoded:
+            return None, 0
+
+        detections = self.detect_faces_many([img for _, img in decoded])
+        crops = registration_crops(decoded, detections)
+        if not crops:
+            return None, 0
+        return robust_mean_embedding(self.embed_faces(crops))
+
+    def shutdown(self):
+        self.readers.shutdown()
+        if self.pool is not None:
+            self.pool.shutdown()
+
+
+def update_roster(intake, course, state):
+    """Add every enrolled student missing from the course roster"""
+    today = date.today().strftime('%Y-%m-%d')
+    return sum(roster_store.add(intake, course, studentid, entry['name'], today)
+               for studentid, entry in state.items())
+
+
+def enroll(root, processes, force=False, window=None):
+    enroller = Enroller(processes)
+    # Students embedded at the same time; one student's ~30 crops only fill a few workers
+    window = window or (max(2, processes) if processes > 0 else 1)
+    students = ThreadPoolExecutor(max_workers=window)
+    started = time.time()
+    totals = {'enrolled': 0, 'skipped': 0, 'failed': 0, 'images': 0}
+    courses = {}
+    pending = {}  # future -> (intake, course, studentid, name, files, signature)
+
+    def finish(future):
+        intake, course, studentid, name, files, signature = pending.pop(future)
+        folder_path = os.path.join("Students", intake, course)
+        state = courses[(intake, course)]
+        try:
+            embedding, used = future.result()
+        except Exception as e:
+            print(f"❌ {intake}/{course} {studentid}: {e}")
+            totals['failed'] += 1
+            return
+        totals['images'] += len(files)
+
+        if embedding is None or not gallery_store.append(folder_path, name, studentid, embedding):
+            print(f"⚠️ {intake}/{course} {studentid}: no valid faces in {len(files)} images")
+            totals['failed'] += 1
+            return
+
+        # Saved after every student so a restart resumes where this run stopped
+        state[studentid] = {'name': name, 'signature': signature, 'images': used}
+        write_state(folder_path, state)
+        totals['enrolled'] += 1
+        print(f"✅ {intake}/{course} {studentid} - {name} ({used}/{len(files)} images)")
+
+    try:
+        for intake, course, studentid, name, files in find_students(root):
+            folder_path = os.path.join("Students", intake, course)
+            if (intake, course) not in courses:
+                os.makedirs(folder_path, exist_ok=True)
+                gallery_store.migrate_npy_files(folder_path)
+                courses[(intake, course)] = read_state(folder_path)
+            state = courses[(intake, course)]
+
+            signature = photo_signature(files)
+            if not force and state.get(studentid, {}).get('signature') == signature:
+                totals['skipped'] += 1
+                continue
+
+            # Stores and state files are only written from this thread, as students finish
+            while len(pending) >= window:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(future)
+            pending[students.submit(enroller.student_embedding, files)] = (
+                intake, course, studentid, name, files, signature)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                finish(future)
+    finally:
+        students.shutdown(cancel_futures=True)
+        enroller.shutdown()
+
+    for (intake, course), state in courses.items():
+        added = update_roster(intake, course, state)
+        if added:
+            print(f"Added {added} students to the {intake} {course} roster")
+
+    elapsed = time.time() - started
+    print(f"\nEnrolled {totals['enrolled']}, skipped {totals['skipped']} up to date, "
+          f"failed {totals['failed']} in {elapsed:.1f}s")
+    if totals['images']:
+        print(f"Throughput: {totals['images'] / elapsed:.1f} images/s, "
+              f"{(totals['enrolled'] + totals['failed']) / elapsed:.2f} students/s")
+    return totals
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Enroll students from <intake>/<course>/<studentid>_<name>/ folders")
+    parser.add_argument('root', help="folder containing one sub-folder per intake")
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                        help="face worker processes (0 = run in this process)")
+    parser.add_argument('--force', action='store_true', help="re-enroll students even if their photos are unchanged")
+    parser.add_argument('--window', type=int,
+                        help="students embedded at the same time (default: --processes, at least 2)")
+    args = parser.parse_args()
+    enroll(args.root, args.processes, args.force, args.window)
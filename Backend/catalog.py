@@ -0,0 +1,84 @@
+import os
+import threading
+import time
+
+import attendance_store
+import roster_store
+
+# How often the Students tree is re-checked for new intake or course folders
+CATALOG_REFRESH_SECONDS = float(os.environ.get('CATALOG_REFRESH_SECONDS', 10.0))
+
+
+class Catalog:
+    """In-memory intake -> course -> subjects tree, rebuilt only when something changed
+
+    Folders under base_dir are checked by directory mtime, and the database by its data
+    version, at most every refresh_seconds. Writes through the server call invalidate()
+    so they show up at once; the data version catches bulk_enroll.py and other processes.
+    """
+
+    def __init__(self, base_dir="../Students", refresh_seconds=CATALOG_REFRESH_SECONDS):
+        self.base_dir = base_dir
+        self.refresh_seconds = refresh_seconds
+        self._tree = None
+        self._mtimes = None  # folder -> mtime, plus the database's data version under None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._tree = None
+
+    def tree(self):
+        """Return {intake: {course: [subjects]}}; callers must not modify it"""
+        with self._lock:
+            now = time.monotonic()
+            if self._tree is not None and now - self._checked < self.refresh_seconds:
+                return self._tree
+            self._checked = now
+
+            mtimes = self._folder_mtimes()
+            mtimes[None] = attendance_store.data_version()
+            if self._tree is None or mtimes != self._mtimes:
+                self._tree = self._build()
+                self._mtimes = mtimes
+            return self._tree
+
+    def intakes(self):
+        return list(self.tree())
+
+    def courses(self, intake):
+        return list(self.tree().get(intake, {}))
+
+    def _folder_mtimes(self):
+        # Adding or removing an entry updates its parent folder's mtime
+        mtimes = {}
+        try:
+            mtimes[self.base_dir] = os.stat(self.base_dir).st_mtime_ns
+            with os.scandir(self.base_dir) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        mtimes[entry.path] = entry.stat().st_mtime_ns
+        except FileNotFoundError:
+            pass
+        return mtimes
+
+    def _build(self):
+        tree = {}
+        try:
+            with os.scandir(self.base_dir) as intakes:
+                for intake in sorted(intakes, key=lambda e: e.name):
+                    if not intake.is_dir():
+                        continue
+                    with os.scandir(intake.path) as courses:
+                        tree[intake.name] = {course.name: [] for course in sorted(courses, key=lambda e: e.name)
+                                             if course.is_dir()}
+        except FileNotFoundError:
+            pass
+
+        # Registered students and saved attendance no longer create folders of their own
+        for intake, course in roster_store.courses():
+            tree.setdefault(intake, {}).setdefault(course, [])
+        for intake, course, subject in attendance_store.all_subjects():
+            tree.setdefault(intake, {}).setdefault(course, []).append(subject)
+        return tree
@@ -0,0 +1,164 @@
+import os
+import sys
+import threading
+import time
+
+import cv2
+
+# Default backend for this deployment: mtcnn, yunet or haar
+DETECTOR_BACKEND = os.environ.get('DETECTOR_BACKEND', 'mtcnn')
+# Longest image side used for detection; larger frames are downscaled first (0 = full resolution)
+DETECTION_MAX_SIDE = int(os.environ.get('DETECTION_MAX_SIDE', 0))
+# YuNet needs its ONNX model from the OpenCV model zoo
+YUNET_MODEL_PATH = os.environ.get('YUNET_MODEL_PATH', os.path.join('models', 'face_detection_yunet_2023mar.onnx'))
+YUNET_SCORE_THRESHOLD = float(os.environ.get('YUNET_SCORE_THRESHOLD', 0.7))
+
+
+def os_lock():
+    """A real OS lock, even after eventlet.monkey_patch()
+
+    The server builds and runs the models from eventlet's native tpool threads, and a green
+    lock released from one of those never wakes a waiter on the main hub.
+    """
+    try:
+        from eventlet.patcher import original
+    except ImportError:
+        return threading.Lock()
+    return original('threading').Lock()
+
+
+class MTCNNDetector:
+    def __init__(self):
+        from mtcnn import MTCNN
+        self._detector = MTCNN()
+
+    def detect(self, img):
+        return self._detector.detect_faces(img)
+
+
+class YuNetDetector:
+    def __init__(self):
+        self._detector = cv2.FaceDetectorYN.create(YUNET_MODEL_PATH, "", (320, 320), YUNET_SCORE_THRESHOLD)
+        self._lock = os_lock()
+
+    def detect(self, img):
+        with self._lock:
+            self._detector.setInputSize((img.shape[1], img.shape[0]))
+            _, faces = self._detector.detect(img)
+        if faces is None:
+            return []
+        return [{'box': [int(v) for v in face[:4]], 'confidence': float(face[-1])} for face in faces]
+
+
+class HaarDetector:
+    """Cheap Haar cascade pass - no confidence score, so every face reports 1.0"""
+
+    def __init__(self):
+        self._detector = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+
+    def detect(self, img):
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        faces = self._detector.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(15, 15))
+        return [{'box': [int(v) for v in face], 'confidence': 1.0} for face in faces]
+
+
+BACKENDS = {
+    'mtcnn': MTCNNDetector,
+    'yunet': YuNetDetector,
+    'haar': HaarDetector,
+}
+
+_detectors = {}
+_detectors_lock = os_lock()
+
+
+def get_detector(backend=None):
+    """Build each backend once per process"""
+    backend = backend or DETECTOR_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown detector backend: {backend}")
+    with _detectors_lock:
+        if backend not in _detectors:
+            _detectors[backend] = BACKENDS[backend]()
+    return _detectors[backend]
+
+
+def detect_faces(img, backend=None, max_side=None):
+    """Detect faces on a downscaled copy of img and return boxes in full-resolution coordinates"""
+    max_side = DETECTION_MAX_SIDE if max_side is None else max_side
+    scale = 1.0
+    small = img
+    if max_side and max(img.shape[:2]) > max_side:
+        scale = max_side / float(max(img.shape[:2]))
+        small = cv2.resize(img, (int(img.shape[1] * scale), int(img.shape[0] * scale)), interpolation=cv2.INTER_AREA)
+
+    results = get_detector(backend).detect(small)
+    if scale == 1.0:
+        return results
+
+    for face in results:
+        face['box'] = [int(round(v / scale)) for v in face['box']]
+        if 'keypoints' in face:
+            face['keypoints'] = {k: (int(round(x / scale)), int(round(y / scale)))
+                                 for k, (x, y) in face['keypoints'].items()}
+    return results
+
+
+def crop_face(img, box):
+    """Crop a detected face with size-dependent padding; None if the crop is too small to embed"""
+    x, y, w, h = box
+
+    # Adjust padding based on face size
+    padding_factor = 0.05  # Default padding
+    if w > 100:  # Close face
+        padding_factor = 0.02  # Less padding needed for large faces
+    elif w < 30:  # Far face
+        padding_factor = 0.1  # More padding for small faces
+
+    padding_x = int(w * padding_factor)
+    padding_y = int(h * padding_factor)
+
+    # Ensure coordinates are within bounds
+    x_start = max(0, x - padding_x)
+    y_start = max(0, y - padding_y)
+    x_end = min(img.shape[1], x + w + padding_x)
+    y_end = min(img.shape[0], y + h + padding_y)
+
+    face_img = img[y_start:y_end, x_start:x_end]
+
+    # Skip tiny crops that might cause errors
+    if face_img.shape[0] < 10 or face_img.shape[1] < 10:
+        return None
+    return face_img
+
+
+def benchmark(image_dir, backends=None, max_sides=(0, 320)):
+    """Time every backend/scale combination over a folder of images"""
+    images = [cv2.imread(os.path.join(image_dir, f)) for f in sorted(os.listdir(image_dir))
+              if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
+    images = [img for img in images if img is not None]
+    if not images:
+        print(f"No images found in {image_dir}")
+        return
+
+    for backend in backends or BACKENDS:
+        try:
+            get_detector(backend)
+        except Exception as e:
+            print(f"{backend}: unavailable ({e})")
+            continue
+        for max_side in max_sides:
+            detect_faces(images[0], backend, max_side)  # warm-up
+            start = time.time()
+            faces = sum(len(detect_faces(img, backend, max_side)) for img in images)
+            elapsed = time.time() - start
+            print(f"{backend:6s} max_side={max_side or 'full':>4}: "
+                  f"{elapsed / len(images) * 1000:.1f}ms/image, {faces} faces in {len(images)} images")
+
+
+if __name__ == '__main__':
+    # python face_detection.py <folder of images> [backend ...]
+    if len(sys.argv) < 2:
+        print("Usage: python face_detection.py <image folder> [backend ...]")
+        sys.exit(1)
+    benchmark(sys.argv[1], sys.argv[2:] or None)
@@ -0,0 +1,248 @@
+import os
+import sys
+
+import cv2
+import numpy as np
+
+from face_detection import os_lock
+
+ARCFACE_INPUT_SIZE = (112, 112)
+
+# Largest number of crops sent through ArcFace in a single forward pass
+MAX_BATCH_SIZE = int(os.environ.get('EMBED_MAX_BATCH_SIZE', 32))
+
+# keras (DeepFace/TensorFlow), onnx (ONNX Runtime) or tflite
+EMBEDDING_BACKEND = os.environ.get('EMBEDDING_BACKEND', 'keras')
+# CPU threads used by the onnx and tflite runtimes (0 = runtime default)
+EMBEDDING_THREADS = int(os.environ.get('EMBEDDING_THREADS', 0))
+ARCFACE_ONNX_PATH = os.environ.get('ARCFACE_ONNX_PATH', os.path.join('models', 'arcface.onnx'))
+ARCFACE_TFLITE_PATH = os.environ.get('ARCFACE_TFLITE_PATH', os.path.join('models', 'arcface.tflite'))
+# Exported models must agree with Keras at least this closely to reuse existing galleries
+PARITY_MIN_COSINE = float(os.environ.get('EMBEDDING_PARITY_MIN_COSINE', 0.99))
+
+
+
+_model = None
+_model_lock = os_lock()
+_embedders = {}
+
+
+def get_arcface_model():
+    """Build the ArcFace Keras model once and reuse it for every batch"""
+    global _model
+    with _model_lock:
+        if _model is None:
+            # Imported here so that importing this module does not pull in TensorFlow
+            from deepface import DeepFace
+
+            built = DeepFace.build_model('ArcFace')
+            # Newer deepface releases wrap the Keras model in a client object
+            _model = getattr(built, 'model', built)
+    return _model
+
+
+class KerasEmbedder:
+    def __init__(self):
+        self.model = get_arcface_model()
+
+    def __call__(self, batch):
+        # Calling the model directly skips the per-call overhead of Model.predict
+        return np.asarray(self.model(batch, training=False), dtype=np.float32)
+
+
+class OnnxEmbedder:
+    def __init__(self, path=ARCFACE_ONNX_PATH):
+        import onnxruntime as ort
+
+        _require_model(path, 'onnx')
+        options = ort.SessionOptions()
+        if EMBEDDING_THREADS:
+            options.intra_op_num_threads = EMBEDDING_THREADS
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch):
+        return np.asarray(self.session.run(None, {self.input_name: batch})[0], dtype=np.float32)
+
+
+class TFLiteEmbedder:
+    def __init__(self, path=ARCFACE_TFLITE_PATH):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+
+        _require_model(path, 'tflite')
+        self.interpreter = Interpreter(model_path=path, num_threads=EMBEDDING_THREADS or None)
+        self.input_index = self.interpreter.get_input_details()[0]['index']
+        self.output_index = self.interpreter.get_output_details()[0]['index']
+        self._batch_size = None
+        self._lock = os_lock()
+
+    def __call__(self, batch):
+        with self._lock:
+            # The interpreter is resized only when the batch size changes
+            if self._batch_size != len(batch):
+                self.interpreter.resize_tensor_input(self.input_index, list(batch.shape))
+                self.interpreter.allocate_tensors()
+                self._batch_size = len(batch)
+            self.interpreter.set_tensor(self.input_index, batch)
+            self.interpreter.invoke()
+            return np.array(self.interpreter.get_tensor(self.output_index), dtype=np.float32)
+
+
+def _require_model(path, backend):
+    # Never exported on demand: every worker process would write the same file at once
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} not found - run 'python face_embedding.py export {backend}' first")
+
+
+EMBEDDING_BACKENDS = {
+    'keras': KerasEmbedder,
+    'onnx': OnnxEmbedder,
+    'tflite': TFLiteEmbedder,
+}
+
+
+def get_embedder(backend=None):
+    """Build each embedding backend once per process"""
+    backend = backend or EMBEDDING_BACKEND
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend}")
+    with _model_lock:
+        embedder = _embedders.get(backend)
+    if embedder is None:
+        embedder = EMBEDDING_BACKENDS[backend]()
+        with _model_lock:
+            embedder = _embedders.setdefault(backend, embedder)
+    return embedder
+
+
+def export_onnx(path=ARCFACE_ONNX_PATH):
+    """Convert the Keras ArcFace model to ONNX once; needs TensorFlow and tf2onnx"""
+    import tensorflow as tf
+    import tf2onnx
+
+    width, height = ARCFACE_INPUT_SIZE
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    signature = (tf.TensorSpec((None, height, width, 3), tf.float32, name='input'),)
+    # Written next to the target and renamed, so a loader never sees a half-written model
+    tmp_path = path + '.tmp'
+    tf2onnx.convert.from_keras(get_arcface_model(), input_signature=signature, opset=13, output_path=tmp_path)
+    os.replace(tmp_path, path)
+    print(f"Exported ArcFace to {path}")
+    return path
+
+
+def export_tflite(path=ARCFACE_TFLITE_PATH, quantization='float16'):
+    """Convert the Keras ArcFace model to TFLite
+
+    quantization is None, 'float16' (half-size weights) or 'int8' (dynamic-range int8 weights,
+    float activations, so no calibration set is needed).
+    """
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(get_arcface_model())
+    if quantization:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization not in (None, 'int8'):
+        raise ValueError(f"Unknown quantization: {quantization}")
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(converter.convert())
+    os.replace(tmp_path, path)
+    print(f"Exported ArcFace to {path} ({quantization or 'float32'})")
+    return path
+
+
+def preprocess_crops(crops):
+    """Stack BGR face crops into one RGB float32 (N, 112, 112, 3) tensor scaled to [0, 1]
+
+    Current DeepFace releases flip BGR to RGB before model.forward, so the crops are flipped
+    here too. Run 'python face_embedding.py parity deepface <crops>' after upgrading DeepFace
+    to check that batched embeddings still match DeepFace.represent.
+    """
+    width, height = ARCFACE_INPUT_SIZE
+    batch = np.empty((len(crops), height, width, 3), dtype=np.float32)
+    for i, crop in enumerate(crops):
+        if crop.shape[:2] != (height, width):
+            crop = cv2.resize(crop, (width, height))
+        batch[i] = crop[:, :, ::-1]
+    batch /= 255.0
+    return batch
+
+
+def represent_batch(crops, max_batch_size=None, backend=None):
+    """Embed a list of face crops, running one forward pass per chunk of max_batch_size"""
+    if not crops:
+        return np.zeros((0, 512), dtype=np.float32)
+
+    max_batch_size = max_batch_size or MAX_BATCH_SIZE
+    embedder = get_embedder(backend)
+    batch = preprocess_crops(crops)
+
+    outputs = []
+    for start in range(0, len(batch), max_batch_size):
+        outputs.append(embedder(batch[start:start + max_batch_size]))
+    return np.concatenate(outputs)
+
+
+def _represent_deepface(crops):
+    from deepface import DeepFace
+
+    return np.array([
+        DeepFace.represent(crop, model_name='ArcFace', detector_backend='skip', enforce_detection=False)[0]['embedding']
+        for crop in crops
+    ], dtype=np.float32)
+
+
+def parity_check(backend, crops):
+    """Compare a backend's embeddings with the Keras ones; returns (min cosine, mean cosine)
+
+    backend='deepface' instead compares the batched Keras embeddings with DeepFace.represent.
+    """
+    if backend == 'deepface':
+        reference = _represent_deepface(crops)
+        candidate = represent_batch(crops, backend='keras')
+    else:
+        reference = represent_batch(crops, backend='keras')
+        candidate = represent_batch(crops, backend=backend)
+    reference /= np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate /= np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosines = np.sum(reference * candidate, axis=1)
+    return float(cosines.min()), float(cosines.mean())
+
+
+def _load_crops(folder, limit=64):
+    files = sorted(f for f in os.listdir(folder) if f.lower().endswith(('.jpg', '.jpeg', '.png')))[:limit]
+    crops = [cv2.imread(os.path.join(folder, f)) for f in files]
+    return [crop for crop in crops if crop is not None]
+
+
+if __name__ == '__main__':
+    # python face_embedding.py export onnx|tflite [float16|int8|none]
+    # python face_embedding.py parity onnx|tflite|deepface <folder of face crops>
+    if len(sys.argv) >= 3 and sys.argv[1] == 'export':
+        if sys.argv[2] == 'onnx':
+            export_onnx()
+        else:
+            quantization = sys.argv[3] if len(sys.argv) > 3 else 'float16'
+            export_tflite(quantization=None if quantization == 'none' else quantization)
+    elif len(sys.argv) >= 4 and sys.argv[1] == 'parity':
+        crops = _load_crops(sys.argv[3])
+        if not crops:
+            print(f"No face crops found in {sys.argv[3]}")
+            sys.exit(1)
+        min_cosine, mean_cosine = parity_check(sys.argv[2], crops)
+        ok = min_cosine >= PARITY_MIN_COSINE
+        print(f"{sys.argv[2]} vs batched keras over {len(crops)} crops: min cosine {min_cosine:.4f}, "
+              f"mean {mean_cosine:.4f} - {'OK' if ok else 'FAILED'} (needs {PARITY_MIN_COSINE})")
+        sys.exit(0 if ok else 1)
+    else:
+        print("Usage: python face_embedding.py export onnx|tflite [float16|int8|none]\n"
+              "       python face_embedding.py parity onnx|tflite|deepface <folder of face crops>")
+        sys.exit(1)
@@ -0,0 +1,85 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Number of face detection/ArcFace worker processes; 0 keeps inference in the server process
+WORKER_PROCESSES = int(os.environ.get('FACE_WORKER_PROCESSES', 0))
+# Smallest slice of a batch handed to one worker, so small batches stay batched
+MIN_WORKER_CHUNK = int(os.environ.get('FACE_WORKER_MIN_CHUNK', 8))
+
+
+def _init_worker():
+    # Each worker loads its own models once, outside the eventlet hub
+    from face_detection import get_detector
+    from face_embedding import get_embedder
+
+    get_detector()
+    get_embedder()
+    print(f"Face worker {os.getpid()} ready")
+
+
+def _detect_faces(img, backend=None):
+    from face_detection import detect_faces
+    return detect_faces(img, backend)
+
+
+def _represent_batch(crops):
+    from face_embedding import represent_batch
+    return represent_batch(crops)
+
+
+def _warm_up(_):
+    from face_detection import detect_faces
+    from face_embedding import represent_batch
+
+    detect_faces(np.zeros((160, 160, 3), dtype=np.uint8))
+    represent_batch([np.zeros((112, 112, 3), dtype=np.uint8)])
+    return os.getpid()
+
+
+class FacePool:
+    """Runs face detection and ArcFace embedding in a pool of worker processes"""
+
+    def __init__(self, processes):
+        self.processes = processes
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn avoids forking a process that already holds TensorFlow and the eventlet hub
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker
+                )
+        return self._executor
+
+    def detect_faces(self, img, backend=None):
+        # Future.result waits on a (green) condition, so other clients keep being served
+        return self._get_executor().submit(_detect_faces, img, backend).result()
+
+    def detect_faces_many(self, images, backend=None):
+        return list(self._get_executor().map(_detect_faces, images, [backend] * len(images)))
+
+    def warm_up(self):
+        """Start the workers and run a dummy frame through each of them"""
+        return set(self._get_executor().map(_warm_up, range(self.processes)))
+
+    def represent_batch(self, crops):
+        if not crops:
+            return np.zeros((0, 512), dtype=np.float32)
+
+        chunk = max(MIN_WORKER_CHUNK, -(-len(crops) // self.processes))
+        parts = [crops[i:i + chunk] for i in range(0, len(crops), chunk)]
+        return np.concatenate(list(self._get_executor().map(_represent_batch, parts)))
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
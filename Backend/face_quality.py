@@ -0,0 +1,85 @@
+import os
+
+import cv2
+import numpy as np
+
+# Registration crops smaller than this (in pixels, either side) are rejected
+MIN_FACE_SIZE = int(os.environ.get('REGISTRATION_MIN_FACE_SIZE', 40))
+# Variance of the Laplacian on the 112x112 crop below which a face counts as blurry
+BLUR_THRESHOLD = float(os.environ.get('REGISTRATION_BLUR_THRESHOLD', 40.0))
+# Embeddings this many median absolute deviations below the median similarity are dropped
+OUTLIER_MAD_FACTOR = float(os.environ.get('REGISTRATION_OUTLIER_MAD', 3.0))
+
+
+def sharpness(img):
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+def check_face(crop, box):
+    """Return a rejection reason for a registration face, or None if it is usable"""
+    w, h = box[2], box[3]
+    if w < MIN_FACE_SIZE or h < MIN_FACE_SIZE:
+        return f"face too small ({w}x{h})"
+    score = sharpness(crop)
+    if score < BLUR_THRESHOLD:
+        return f"face too blurry (sharpness {score:.0f})"
+    return None
+
+
+def frame_weight(crop, box, confidence):
+    """Weight of one live-frame face in a track's mean: small, blurry or uncertain faces count less"""
+    size = min(1.0, min(box[2], box[3]) / 112.0)
+    focus = min(1.0, sharpness(crop) / BLUR_THRESHOLD)
+    return max(1e-3, size * focus * float(confidence))
+
+
+def registration_crops(images, detections):
+    """Crop the first detected face of each (index, image) pair and drop unusable ones"""
+    crops = []
+    for (i, img), results in zip(images, detections):
+        if not results:
+            print(f"No face detected in image {i}")
+            continue
+
+        x, y, w, h = results[0]['box']
+        x, y = max(0, x), max(0, y)
+        cropped = img[y:y + h, x:x + w]
+
+        if cropped.size == 0:
+            print(f"Cropped face in image {i} is empty")
+            continue
+
+        # Resize and preprocess
+        resized = cv2.resize(cropped, (112, 112))
+
+        # Skip tiny or blurry faces so they don't drag the average embedding
+        rejection = check_face(resized, [x, y, w, h])
+        if rejection:
+            print(f"Rejected image {i}: {rejection}")
+            continue
+
+        crops.append(resized)
+        print(f"Processed image {i} successfully")
+    return crops
+
+
+def robust_mean_embedding(embeddings):
+    """Average embeddings after dropping those far from the consensus direction
+
+    Returns (mean_embedding, number_of_embeddings_kept).
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if len(embeddings) < 3:
+        return np.mean(embeddings, axis=0), len(embeddings)
+
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    unit = embeddings / np.where(norms == 0, 1, norms)
+    centre = unit.mean(axis=0)
+    centre /= np.linalg.norm(centre) or 1
+    similarities = unit @ centre
+
+    median = np.median(similarities)
+    mad = np.median(np.abs(similarities - median)) or 1e-6
+    keep = similarities >= median - OUTLIER_MAD_FACTOR * mad
+    return np.mean(embeddings[keep], axis=0), int(keep.sum())
@@ -0,0 +1,62 @@
+import os
+import threading
+
+# Upper bound on the frame rate advertised to clients
+MAX_TARGET_FPS = float(os.environ.get('MAX_TARGET_FPS', 10))
+# Weight of the newest sample in the processing-time moving average
+PROCESSING_TIME_SMOOTHING = 0.2
+
+
+class FrameScheduler:
+    """Keeps only the newest unprocessed frame of one client
+
+    A frame that arrives while another is being processed replaces the
+    pending one, so a slow server drops stale frames instead of queueing them.
+    """
+
+    def __init__(self):
+        self._pending = None
+        self._busy = False
+        self._lock = threading.Lock()
+        self.last_timestamp = 0
+        self.avg_processing_time = None
+
+    def offer(self, frame):
+        """Store a frame; returns (dropped_frame, should_process)
+
+        should_process is True when the caller has to run the processing loop.
+        """
+        timestamp = frame.get('timestamp', 0)
+        with self._lock:
+            # Frames that arrive out of order are older than what we already have
+            if timestamp and timestamp < self.last_timestamp:
+                return frame, False
+            self.last_timestamp = timestamp
+
+            dropped = self._pending
+            self._pending = frame
+            if self._busy:
+                return dropped, False
+            self._busy = True
+            return dropped, True
+
+    def next(self):
+        """Take the pending frame, or mark the loop finished if there is none"""
+        with self._lock:
+            frame = self._pending
+            self._pending = None
+            if frame is None:
+                self._busy = False
+            return frame
+
+    def record(self, seconds):
+        if self.avg_processing_time is None:
+            self.avg_processing_time = seconds
+        else:
+            self.avg_processing_time += PROCESSING_TIME_SMOOTHING * (seconds - self.avg_processing_time)
+
+    @property
+    def target_fps(self):
+        if not self.avg_processing_time:
+            return MAX_TARGET_FPS
+        return min(MAX_TARGET_FPS, 1.0 / self.avg_processing_time)
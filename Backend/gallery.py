@@ -0,0 +1,149 @@
+import threading
+
+import numpy as np
+
+EMBEDDING_DIM = 512
+
+
+class EmbeddingGallery:
+    """Contiguous, L2-normalised float32 embedding matrix with a parallel name list"""
+
+    def __init__(self, dim=EMBEDDING_DIM, capacity=256):
+        self.dim = dim
+        self._matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self._names = []
+        self._rows = {}  # name -> row index in _matrix
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name in self._rows
+
+    @property
+    def names(self):
+        return list(self._names)
+
+    def row(self, name):
+        return self._rows.get(name)
+
+    def name_at(self, row):
+        return self._names[row]
+
+    @property
+    def matrix(self):
+        # View over the live rows - no copy
+        return self._matrix[:len(self._names)]
+
+    def _grow(self, needed):
+        capacity = self._matrix.shape[0]
+        if needed <= capacity:
+            return
+        capacity = max(capacity, 1)
+        while capacity < needed:
+            capacity *= 2
+        grown = np.zeros((capacity, self.dim), dtype=np.float32)
+        grown[:len(self._names)] = self._matrix[:len(self._names)]
+        self._matrix = grown
+
+    def add(self, name, embedding):
+        """Insert or replace one identity; returns False for unusable vectors"""
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        length = np.linalg.norm(vector)
+        if vector.shape[0] != self.dim or not np.isfinite(length) or length == 0:
+            return False
+
+        with self._lock:
+            row = self._rows.get(name)
+            if row is None:
+                row = len(self._names)
+                self._grow(row + 1)
+                self._names.append(name)
+                self._rows[name] = row
+            self._matrix[row] = vector / length
+        return True
+
+    def attach(self, names, matrix):
+        """Replace the contents with an already-normalised matrix without copying it"""
+        with self._lock:
+            self._matrix = matrix
+            self._names = list(names)
+            self._rows = {name: row for row, name in enumerate(self._names)}
+
+    def remove(self, name):
+        """Remove one identity by moving the last row into its slot"""
+        with self._lock:
+            row = self._rows.pop(name, None)
+            if row is None:
+                return False
+
+            last = len(self._names) - 1
+            if row != last:
+                moved = self._names[last]
+                self._matrix[row] = self._matrix[last]
+                self._names[row] = moved
+                self._rows[moved] = row
+            self._names.pop()
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._names = []
+            self._rows = {}
+
+    def match(self, embedding):
+        """Return (best_name, best_similarity) or (None, 0.0) for an empty gallery"""
+        names, similarities = self.match_many([embedding])
+        if not names:
+            return None, 0.0
+        return names[0], float(similarities[0])
+
+    def match_many(self, embeddings):
+        """Best match for each row of `embeddings` with a single matrix product"""
+        queries = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1, norms)
+
+        with self._lock:
+            size = len(self._names)
+            if size == 0:
+                return [], np.zeros(0, dtype=np.float32)
+            similarities = queries @ self._matrix[:size].T
+            best = np.argmax(similarities, axis=1)
+            names = [self._names[i] for i in best]
+        return names, similarities[np.arange(len(best)), best]
+
+
+class GalleryGroup:
+    """Matches across several galleries without merging them into one matrix"""
+
+    def __init__(self, galleries=()):
+        self.galleries = list(galleries)
+
+    def __len__(self):
+        return sum(len(g) for g in self.galleries)
+
+    @property
+    def names(self):
+        return [name for g in self.galleries for name in g.names]
+
+    def match(self, embedding):
+        names, similarities = self.match_many([embedding])
+        if not names:
+            return None, 0.0
+        return names[0], float(similarities[0])
+
+    def match_many(self, embeddings):
+        best_names, best_similarities = [], np.zeros(0, dtype=np.float32)
+        for g in self.galleries:
+            names, similarities = g.match_many(embeddings)
+            if not names:
+                continue
+            if not best_names:
+                best_names, best_similarities = list(names), np.array(similarities)
+                continue
+            for i in np.flatnonzero(similarities > best_similarities):
+                best_names[i] = names[i]
+                best_similarities[i] = similarities[i]
+        return best_names, best_similarities
@@ -0,0 +1,101 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import gallery_store
+from gallery import EmbeddingGallery
+
+# Memory budget for cached galleries before the least recently used are evicted
+GALLERY_CACHE_MB = int(os.environ.get('GALLERY_CACHE_MB', 512))
+
+
+def _signature(folder):
+    # The manifest is rewritten on every store change, so its mtime identifies the version
+    try:
+        return os.stat(os.path.join(folder, gallery_store.MANIFEST_FILE)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class GalleryCache:
+    """Process-wide LRU cache holding one EmbeddingGallery per (intake, course)"""
+
+    def __init__(self, base_path='Students', budget_mb=GALLERY_CACHE_MB):
+        self.base_path = base_path
+        self.budget_bytes = budget_mb * 1024 * 1024
+        self._entries = OrderedDict()  # (intake, course) -> (signature, gallery)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def total_embeddings(self):
+        return sum(len(g) for _, g in list(self._entries.values()))
+
+    @property
+    def size_bytes(self):
+        return sum(g.matrix.nbytes for _, g in self._entries.values())
+
+    def _folder(self, intake, course):
+        return os.path.join(self.base_path, intake, course)
+
+    def get(self, intake, course):
+        """Return the gallery for one intake/course, reloading it only if its store changed"""
+        key = (intake, course)
+        folder = self._folder(intake, course)
+        signature = _signature(folder)
+        if signature is None:
+            # No manifest yet: pack any legacy .npy files first
+            gallery_store.migrate_npy_files(folder)
+            signature = _signature(folder)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        store = gallery_store.load(folder)
+        gallery = EmbeddingGallery()
+        if store is not None:
+            keys, matrix, _ = store
+            gallery.attach(keys, matrix)
+
+        with self._lock:
+            self._entries[key] = (signature, gallery)
+            self._entries.move_to_end(key)
+            self._evict()
+        print(f"Loaded {len(gallery)} embeddings for {intake} {course}")
+        return gallery
+
+    def _evict(self):
+        # Sessions keep their own reference, so evicting never breaks a running session
+        while len(self._entries) > 1 and self.size_bytes > self.budget_bytes:
+            key, _ = self._entries.popitem(last=False)
+            print(f"Evicted gallery for {key[0]} {key[1]}")
+
+    def _restamp(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries[key] = (_signature(self._folder(*key)), entry[1])
+        return entry
+
+    def add(self, intake, course, name, embedding):
+        """Apply a store append to the cached gallery in place"""
+        with self._lock:
+            entry = self._restamp((intake, course))
+        if entry is not None:
+            entry[1].add(name, np.asarray(embedding, dtype=np.float32))
+
+    def remove(self, intake, course, studentid):
+        """Apply a store tombstone to the cached gallery in place"""
+        with self._lock:
+            entry = self._restamp((intake, course))
+        if entry is None:
+            return
+        for name in entry[1].names:
+            if name.rsplit('_', 1)[-1] == studentid:
+                entry[1].remove(name)
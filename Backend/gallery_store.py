@@ -0,0 +1,252 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from gallery import EMBEDDING_DIM
+
+# One packed store per Students/<intake>/<course> folder
+MATRIX_FILE = 'gallery.f32'
+MANIFEST_FILE = 'gallery.json'
+# Held by every writer, in this process or another one (bulk_enroll.py, a second server)
+LOCK_FILE = 'gallery.lock'
+
+# Rewrite the matrix once this share of its rows are tombstones
+COMPACT_RATIO = 0.25
+
+_write_lock = threading.Lock()
+
+try:
+    import fcntl
+
+    def _lock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def _unlock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+except ImportError:  # Windows
+    import msvcrt
+
+    def _lock_file(f):
+        f.seek(0)
+        while True:
+            try:
+                # LK_LOCK gives up after about 10 seconds, so keep waiting
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                pass
+
+    def _unlock_file(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def _locked(folder):
+    """Hold the store's lock against other threads and other processes"""
+    with _write_lock:
+        with open(os.path.join(folder, LOCK_FILE), 'a+b') as f:
+            _lock_file(f)
+            try:
+                yield
+            finally:
+                _unlock_file(f)
+
+
+def _empty_manifest(dim=EMBEDDING_DIM):
+    return {"version": 0, "dim": dim, "rows": [], "matrix": MATRIX_FILE}
+
+
+def _matrix_path(folder, manifest):
+    # Compaction moves the rows to a new file named in the manifest
+    return os.path.join(folder, manifest.get('matrix', MATRIX_FILE))
+
+
+def read_manifest(folder):
+    path = os.path.join(folder, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_manifest(folder, manifest):
+    # Write then rename so readers never see a half-written manifest
+    path = os.path.join(folder, MANIFEST_FILE)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+
+def _normalise(embedding, dim):
+    vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+    length = np.linalg.norm(vector)
+    if vector.shape[0] != dim or not np.isfinite(length) or length == 0:
+        return None
+    return vector / length
+
+
+def _write_rows(path, vectors, start_row, dim):
+    # Rows beyond the manifest (e.g. from an interrupted append) are overwritten, never truncated:
+    # Windows refuses to shrink a file that a gallery still has mapped
+    with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+        f.seek(start_row * dim * 4)
+        f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+
+
+def append(folder, name, studentid, embedding):
+    """Append one student's embedding, tombstoning any earlier row for the same ID"""
+    studentid = str(studentid).strip()
+    os.makedirs(folder, exist_ok=True)
+    with _locked(folder):
+        manifest = read_manifest(folder) or _empty_manifest()
+        vector = _normalise(embedding, manifest['dim'])
+        if vector is None:
+            return False
+
+        for row in manifest['rows']:
+            if row['studentid'] == studentid:
+                row['deleted'] = True
+
+        _write_rows(_matrix_path(folder, manifest), vector[np.newaxis], len(manifest['rows']), manifest['dim'])
+        manifest['rows'].append({
+            "key": f"{name}_{studentid}",
+            "name": name,
+            "studentid": studentid,
+            "deleted": False
+        })
+        manifest['version'] += 1
+        _write_manifest(folder, manifest)
+        _maybe_compact(folder, manifest)
+        return True
+
+
+def tombstone(folder, studentid):
+    """Mark a student's rows deleted; returns False if they were not in the store"""
+    studentid = str(studentid).strip()
+    if not os.path.isdir(folder):
+        return False
+    with _locked(folder):
+        manifest = read_manifest(folder)
+        if manifest is None:
+            return False
+
+        found = False
+        for row in manifest['rows']:
+            if row['studentid'] == studentid and not row['deleted']:
+                row['deleted'] = True
+                found = True
+        if not found:
+            return False
+
+        manifest['version'] += 1
+        _write_manifest(folder, manifest)
+        _maybe_compact(folder, manifest)
+        return True
+
+
+def _maybe_compact(folder, manifest):
+    deleted = [row['deleted'] for row in manifest['rows']]
+    if not deleted or sum(deleted) < COMPACT_RATIO * len(deleted):
+        return
+
+    matrix, _ = _map_matrix(folder, manifest)
+    live_rows = np.array(matrix[~np.array(deleted)])
+    del matrix
+
+    # The live rows go to a new file: galleries may still be mapping the old one,
+    # and Windows refuses to replace or truncate a mapped file
+    matrix_file = f"gallery.{manifest['version'] + 1}.f32"
+    with open(os.path.join(folder, matrix_file), 'wb') as f:
+        f.write(live_rows.tobytes())
+    manifest['rows'] = [row for row in manifest['rows'] if not row['deleted']]
+    manifest['matrix'] = matrix_file
+    manifest['version'] += 1
+    _write_manifest(folder, manifest)
+    _remove_old_matrices(folder, matrix_file)
+
+
+def _remove_old_matrices(folder, current):
+    for file in os.listdir(folder):
+        if file.startswith('gallery.') and file.endswith('.f32') and file != current:
+            try:
+                os.remove(os.path.join(folder, file))
+            except OSError:
+                pass  # still mapped on Windows; the next compaction tries again
+
+
+def _map_matrix(folder, manifest):
+    count = len(manifest['rows'])
+    if count == 0:
+        return np.zeros((0, manifest['dim']), dtype=np.float32), manifest
+    # Copy-on-write: callers may modify rows in memory without touching the file
+    matrix = np.memmap(_matrix_path(folder, manifest), dtype=np.float32, mode='c',
+                       shape=(count, manifest['dim']))
+    return matrix, manifest
+
+
+def load(folder):
+    """Return (keys, matrix, version) for the live rows of a store, or None if there is none
+
+    The matrix is a memory map of the store file when it has no tombstones.
+    """
+    # Hold the store's lock so the manifest and matrix file are from the same version
+    if not os.path.isdir(folder):
+        return None
+    with _locked(folder):
+        manifest = read_manifest(folder)
+        if manifest is None:
+            return None
+        matrix, manifest = _map_matrix(folder, manifest)
+
+    live = [not row['deleted'] for row in manifest['rows']]
+    keys = [row['key'] for row in manifest['rows'] if not row['deleted']]
+    if not all(live):
+        matrix = np.array(matrix[np.array(live)])
+    return keys, matrix, manifest['version']
+
+
+def migrate_npy_files(folder):
+    """One-time packing of legacy name_studentid.npy files into a store"""
+    if not os.path.isdir(folder) or read_manifest(folder) is not None:
+        return 0
+    with _locked(folder):
+        if read_manifest(folder) is not None:
+            return 0
+
+        manifest = _empty_manifest()
+        vectors = []
+        for file in sorted(os.listdir(folder)):
+            if not file.endswith('.npy'):
+                continue
+            key = file.replace('.npy', '')
+            name, _, studentid = key.rpartition('_')
+            try:
+                vector = _normalise(np.load(os.path.join(folder, file)), manifest['dim'])
+            except Exception as e:
+                print(f"Error migrating embedding {file}: {e}")
+                continue
+            if vector is None:
+                print(f"Skipping invalid embedding {file}")
+                continue
+            vectors.append(vector)
+            manifest['rows'].append({"key": key, "name": name, "studentid": studentid, "deleted": False})
+
+        if not vectors:
+            return 0
+
+        _write_rows(_matrix_path(folder, manifest), np.stack(vectors), 0, manifest['dim'])
+        manifest['version'] = 1
+        _write_manifest(folder, manifest)
+        print(f"Migrated {len(vectors)} embedding files in {folder}")
+        return len(vectors)
+
+
+def open_store(folder):
+    """Load a folder's store, migrating legacy .npy files on first use"""
+    migrate_npy_files(folder)
+    return load(folder)
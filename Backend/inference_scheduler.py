@@ -0,0 +1,103 @@
+import os
+import queue
+import threading
+import time
+
+# Longest time the worker holds a batch open waiting for more crops
+MAX_WAIT_MS = float(os.environ.get('SCHEDULER_MAX_WAIT_MS', 5))
+# Pending requests allowed before new submissions are rejected
+MAX_QUEUE_DEPTH = int(os.environ.get('SCHEDULER_MAX_QUEUE_DEPTH', 64))
+
+
+class SchedulerBusyError(Exception):
+    pass
+
+
+class _Request:
+    def __init__(self, crops):
+        self.crops = crops
+        self.enqueued_at = time.time()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.wait_time = 0.0
+
+
+class InferenceScheduler:
+    """Collects face crops from many clients and embeds them in shared batches"""
+
+    def __init__(self, embed_fn, max_batch_size, max_wait_ms=MAX_WAIT_MS, max_queue_depth=MAX_QUEUE_DEPTH):
+        self.embed_fn = embed_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue(maxsize=max_queue_depth)
+        self._carry = None  # request that did not fit in the previous batch
+        self._worker = None
+        self._start_lock = threading.Lock()
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize() + (1 if self._carry is not None else 0)
+
+    def start(self):
+        with self._start_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='inference-scheduler', daemon=True)
+                self._worker.start()
+
+    def submit(self, crops, timeout=None):
+        """Queue crops and wait for their embeddings; returns (embeddings, queue_wait_seconds)"""
+        self.start()
+        req = _Request(crops)
+        try:
+            self._queue.put_nowait(req)
+        except queue.Full:
+            raise SchedulerBusyError(f"Inference queue is full ({self._queue.maxsize} pending requests)")
+
+        if not req.done.wait(timeout):
+            raise TimeoutError("Timed out waiting for embeddings")
+        if req.error is not None:
+            raise req.error
+        return req.result, req.wait_time
+
+    def _collect(self):
+        first = self._carry if self._carry is not None else self._queue.get()
+        self._carry = None
+
+        batch = [first]
+        size = len(first.crops)
+        deadline = time.time() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                req = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if size + len(req.crops) > self.max_batch_size:
+                self._carry = req
+                break
+            batch.append(req)
+            size += len(req.crops)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.time()
+            for req in batch:
+                req.wait_time = started - req.enqueued_at
+
+            try:
+                embeddings = self.embed_fn([crop for req in batch for crop in req.crops])
+                offset = 0
+                for req in batch:
+                    req.result = embeddings[offset:offset + len(req.crops)]
+                    offset += len(req.crops)
+            except Exception as e:
+                for req in batch:
+                    req.error = e
+
+            for req in batch:
+                req.done.set()
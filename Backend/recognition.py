@@ -0,0 +1,132 @@
+"""Detect -> crop -> embed -> match for one frame, shared by the Socket.IO handler and benchmark.py"""
+import os
+import time
+from contextlib import nullcontext
+
+import cv2
+import numpy as np
+
+import face_detection
+from face_quality import frame_weight
+
+# Only the largest faces of a frame are recognised
+MAX_FACES = 3
+# Faces narrower or shorter than this (pixels) are too far away to recognise
+MIN_FACE_SIZE = 15
+# Similarity a match has to exceed; faces under FAR_FACE_WIDTH pixels wide use FAR_THRESHOLD
+THRESHOLD = 0.75
+FAR_THRESHOLD = 0.72
+FAR_FACE_WIDTH = 30
+
+DEBUG_LOGGING = os.environ.get('LOG_LEVEL', 'INFO').upper() == 'DEBUG'
+
+
+def debug(message):
+    if DEBUG_LOGGING:
+        print(message)
+
+
+class EmbeddingFailed(Exception):
+    """Embedding a frame's faces failed; boxes are the faces that were being embedded"""
+
+    def __init__(self, boxes, error):
+        super().__init__(str(error))
+        self.boxes = boxes
+
+
+def match_threshold(width, aggregate=False):
+    # Smaller faces (further away) get a lower threshold; an aggregate has to earn the full one
+    if width < FAR_FACE_WIDTH and not aggregate:
+        return FAR_THRESHOLD
+    return THRESHOLD
+
+
+def _untimed(stage):
+    return nullcontext()
+
+
+def recognise_frame(img, detect, embed, matcher, tracker=None, aggregate=False, now=None,
+                    timed=_untimed, on_detected=None):
+    """Recognise the largest faces in one decoded frame
+
+    detect(img) returns detections, embed(crops) one embedding per 112x112 crop and
+    timed(stage) is a context manager around each stage. on_detected(sorted detections)
+    is called before anything is embedded. With a tracker, faces whose track still holds
+    its identity are not embedded again.
+
+    Returns a list of faces, largest first, each a dict with index, box, confidence, crop,
+    track, name, similarity, embedded and threshold. The list is not matched at all
+    (every name None) when matcher is empty. Raises EmbeddingFailed if embed() does.
+    """
+    with timed('detect'):
+        detections = detect(img)
+    debug(f"👁️ Detected {len(detections)} faces in frame")
+    if not detections:
+        return []
+
+    sorted_faces = sorted(detections, key=lambda x: x['box'][2] * x['box'][3], reverse=True)
+    if on_detected:
+        on_detected(sorted_faces)
+
+    faces = []
+    with timed('crop'):
+        for i, face in enumerate(sorted_faces[:MAX_FACES]):
+            x, y, w, h = face['box']
+            debug(f"🔍 Processing face #{i + 1}: Size {w}x{h}, Confidence: {face['confidence']:.2f}")
+
+            # Skip extremely small faces (probably too far)
+            if w < MIN_FACE_SIZE or h < MIN_FACE_SIZE:
+                debug(f"⏭️ Skipping face #{i + 1}: Too small ({w}x{h})")
+                continue
+
+            crop = face_detection.crop_face(img, [x, y, w, h])
+            if crop is None:
+                debug(f"⏭️ Skipping face #{i + 1}: Cropped size too small")
+                continue
+
+            faces.append({
+                'index': i, 'box': [x, y, w, h], 'confidence': float(face['confidence']), 'crop': crop,
+                'track': None, 'name': None, 'similarity': 0.0, 'embedded': False,
+                'threshold': match_threshold(w, aggregate)
+            })
+
+    if not faces or not len(matcher):
+        return faces
+
+    # Confirmed tracks keep their identity; only new, drifting or stale faces are embedded
+    now = now if now is not None else time.time()
+    if tracker is not None:
+        for face, track in zip(faces, tracker.update([face['box'] for face in faces], now)):
+            face['track'] = track
+            face['name'] = track.name
+            face['similarity'] = track.similarity
+    to_embed = [face for face in faces
+                if face['track'] is None or face['track'].needs_embedding(now, aggregate=aggregate)]
+    if not to_embed:
+        return faces
+
+    try:
+        # Pre-resize the images to exactly what ArcFace needs to avoid extra processing
+        with timed('embed'):
+            embeddings = embed([cv2.resize(face['crop'], (112, 112)) for face in to_embed])
+    except Exception as e:
+        raise EmbeddingFailed([face['box'] for face in to_embed], e) from e
+
+    # Aggregation mode matches each track's quality-weighted mean over frames, not this frame alone
+    if aggregate:
+        embeddings = np.stack([
+            face['track'].aggregate(embedding, frame_weight(face['crop'], face['box'], face['confidence']))
+            if face['track'] is not None else embedding
+            for face, embedding in zip(to_embed, embeddings)
+        ])
+
+    # Match every embedded face against the gallery with one matrix product
+    with timed('match'):
+        names, similarities = matcher.match_many(embeddings)
+    for face, name, similarity in zip(to_embed, names, similarities):
+        face['name'] = name
+        face['similarity'] = float(similarity)
+        face['embedded'] = True
+        if face['track'] is not None:
+            face['track'].record(name, face['similarity'], face['similarity'] > face['threshold'], now)
+    return faces
@@ -0,0 +1,134 @@
+import io
+import os
+import threading
+
+import attendance_store
+
+# Registered students, kept in the attendance database so writes are transactional and locked
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS roster (
+    intake TEXT NOT NULL,
+    course TEXT NOT NULL,
+    studentid TEXT NOT NULL,
+    name TEXT NOT NULL,
+    registered TEXT NOT NULL,
+    PRIMARY KEY (intake, course, studentid)
+);
+-- Courses whose legacy roster workbook has already been imported
+CREATE TABLE IF NOT EXISTS roster_imports (
+    intake TEXT NOT NULL,
+    course TEXT NOT NULL,
+    PRIMARY KEY (intake, course)
+);
+"""
+
+_lock = threading.Lock()
+_schema_ready = False
+# (intake, course) pairs whose legacy workbook this process has already checked for
+_imported = set()
+
+
+def _connect():
+    global _schema_ready
+    conn = attendance_store.connect()
+    if not _schema_ready:
+        conn.executescript(SCHEMA)
+        _schema_ready = True
+    return conn
+
+
+def roster_path(intake, course):
+    return os.path.join(f"../Students/{intake}/{course}", f"{intake} {course}.xlsx")
+
+
+def _ensure_imported(intake, course):
+    # Caller holds _lock
+    if (intake, course) not in _imported:
+        conn = _connect()
+        if not conn.execute("SELECT 1 FROM roster_imports WHERE intake = ? AND course = ?",
+                            (intake, course)).fetchone():
+            _import_sheet(conn, intake, course)
+        _imported.add((intake, course))
+
+
+def _text(value):
+    # Empty Excel cells come back as NaN
+    return value if isinstance(value, str) else ('' if value is None or value != value else str(value))
+
+
+def _import_sheet(conn, intake, course):
+    """Bring a course's legacy roster workbook into the database the first time it is used"""
+    file_path = roster_path(intake, course)
+    rows = []
+    if os.path.exists(file_path):
+        import pandas as pd
+
+        df = pd.read_excel(file_path)
+        df['StudentID'] = df['StudentID'].astype(str).str.strip()
+        rows = [(intake, course, row['StudentID'], _text(row.get('Name')), _text(row.get('Date')))
+                for row in df.to_dict('records')]
+        print(f"Imported {len(rows)} students from {file_path}")
+
+    with attendance_store.transaction():
+        conn.executemany(
+            "INSERT OR IGNORE INTO roster (intake, course, studentid, name, registered) VALUES (?, ?, ?, ?, ?)",
+            rows
+        )
+        conn.execute("INSERT OR IGNORE INTO roster_imports (intake, course) VALUES (?, ?)", (intake, course))
+
+
+def add(intake, course, studentid, name, registered):
+    """Claim a student ID for the course; returns False if it is already registered"""
+    studentid = str(studentid).strip()
+    with _lock:
+        _ensure_imported(intake, course)
+        with attendance_store.transaction() as conn:
+            # The primary key decides: bulk_enroll.py or another server process may have changed the roster
+            added = conn.execute(
+                "INSERT INTO roster (intake, course, studentid, name, registered) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (intake, course, studentid) DO NOTHING",
+                (intake, course, studentid, name, registered)
+            ).rowcount
+        return bool(added)
+
+
+def remove(intake, course, studentid, name=None):
+    """Remove a student, matching the name case-insensitively when one is given"""
+    studentid = str(studentid).strip()
+    with _lock:
+        _ensure_imported(intake, course)
+        # Always ask the database: the ID may have been added by another process
+        query = "DELETE FROM roster WHERE intake = ? AND course = ? AND studentid = ?"
+        params = (intake, course, studentid)
+        if name is not None:
+            query += " AND LOWER(TRIM(name)) = ?"
+            params += (name.strip().lower(),)
+        with attendance_store.transaction() as conn:
+            removed = conn.execute(query, params).rowcount
+        return bool(removed)
+
+
+def courses():
+    """Every (intake, course) with at least one registered student"""
+    return _connect().execute("SELECT DISTINCT intake, course FROM roster ORDER BY intake, course").fetchall()
+
+
+def students(intake, course):
+    with _lock:
+        _ensure_imported(intake, course)
+    return [{"Name": name, "StudentID": studentid, "Intake": intake, "Course": course, "Date": registered}
+            for studentid, name, registered in _connect().execute(
+                "SELECT studentid, name, registered FROM roster WHERE intake = ? AND course = ? ORDER BY rowid",
+                (intake, course)
+            )]
+
+
+def export_workbook(intake, course):
+    """The course roster in the old <intake> <course>.xlsx layout"""
+    import pandas as pd
+
+    output = io.BytesIO()
+    df = pd.DataFrame(students(intake, course), columns=["Name", "StudentID", "Intake", "Course", "Date"])
+    df.to_excel(output, index=False, engine='openpyxl')
+    output.seek(0)
+    return output
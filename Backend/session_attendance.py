@@ -0,0 +1,63 @@
+import os
+import threading
+import time
+import uuid
+from datetime import date
+
+import attendance_store
+
+# Frames a student must be recognised in before the session counts them present
+MIN_VOTES = int(os.environ.get('ATTENDANCE_MIN_VOTES', 3))
+# Pending sightings are written to the attendance store at least this often
+FLUSH_SECONDS = float(os.environ.get('ATTENDANCE_FLUSH_SECONDS', 5.0))
+# ... or as soon as this many students have unsaved sightings
+FLUSH_BATCH = int(os.environ.get('ATTENDANCE_FLUSH_BATCH', 50))
+
+
+class SessionAttendance:
+    """Collects who a recognition session has seen and writes it to the attendance store in batches
+
+    Rows are keyed by session_id, so a client that reconnects with the same id keeps its presence.
+    """
+
+    def __init__(self, intake, course, session_id=None, day=None):
+        self.session_id = session_id or uuid.uuid4().hex
+        self.intake = intake
+        self.course = course
+        self.day = day or date.today()
+        self._pending = {}  # studentid -> [name, first_seen, last_seen, votes]
+        self._last_flush = time.time()
+        self._lock = threading.Lock()
+
+    def observe(self, key, now=None):
+        """Count one recognition of a gallery key ("<name>_<studentid>")"""
+        now = now or time.time()
+        name, _, studentid = key.rpartition('_')
+        with self._lock:
+            seen = self._pending.get(studentid)
+            if seen is None:
+                self._pending[studentid] = [name, now, now, 1]
+            else:
+                seen[2] = now
+                seen[3] += 1
+            due = len(self._pending) >= FLUSH_BATCH or now - self._last_flush >= FLUSH_SECONDS
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.time()
+        if pending:
+            try:
+                attendance_store.add_presence(self.session_id, self.intake, self.course, self.day,
+                                              {k: tuple(v) for k, v in pending.items()})
+            except Exception as e:
+                print(f"❌ Failed to save session presence: {e}")
+                # Keep the sightings for the next flush
+                with self._lock:
+                    for studentid, seen in pending.items():
+                        current = self._pending.setdefault(studentid, seen)
+                        if current is not seen:
+                            current[1] = min(current[1], seen[1])
+                            current[3] += seen[3]
@@ -0,0 +1,121 @@
+import os
+import time
+
+import numpy as np
+
+# Confirmed tracks are re-embedded at least this often
+TRACK_REFRESH_SECONDS = float(os.environ.get('TRACK_REFRESH_SECONDS', 2.0))
+# Unconfirmed tracks (unknown, far or below-threshold faces) wait this long before their first retry,
+# doubling after every further miss up to TRACK_REFRESH_SECONDS
+TRACK_UNCONFIRMED_REFRESH_SECONDS = float(os.environ.get('TRACK_UNCONFIRMED_REFRESH_SECONDS', 0.25))
+# Minimum IoU for a detection to continue an existing track
+TRACK_MATCH_IOU = float(os.environ.get('TRACK_MATCH_IOU', 0.3))
+# Re-embed once the face has moved this far from where it was last embedded
+TRACK_DRIFT_IOU = float(os.environ.get('TRACK_DRIFT_IOU', 0.5))
+# Tracks not seen for this long are dropped
+TRACK_MAX_AGE = float(os.environ.get('TRACK_MAX_AGE', 1.0))
+# Match each track's running mean embedding instead of single frames (sessions can override)
+TRACK_AGGREGATION = os.environ.get('TRACK_AGGREGATION', '0') == '1'
+# A new embedding this dissimilar from the running mean starts the mean again (someone else)
+TRACK_AGGREGATE_RESET = float(os.environ.get('TRACK_AGGREGATE_RESET', 0.5))
+
+
+def iou(a, b):
+    """Intersection over union of two [x, y, w, h] boxes"""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    inter_w = min(ax + aw, bx + bw) - max(ax, bx)
+    inter_h = min(ay + ah, by + bh) - max(ay, by)
+    if inter_w <= 0 or inter_h <= 0:
+        return 0.0
+    inter = inter_w * inter_h
+    return inter / float(aw * ah + bw * bh - inter)
+
+
+class Track:
+    def __init__(self, track_id, box, now):
+        self.id = track_id
+        self.box = box
+        self.last_seen = now
+        self.name = None
+        self.similarity = 0.0
+        self.confirmed = False
+        self.embedded_box = None
+        self.embedded_at = 0.0
+        self.misses = 0  # embeddings in a row that did not confirm the track
+        self._embedding_sum = None
+        self.frames = 0
+
+    def needs_embedding(self, now, refresh_seconds=TRACK_REFRESH_SECONDS, drift_iou=TRACK_DRIFT_IOU,
+                        unconfirmed_seconds=TRACK_UNCONFIRMED_REFRESH_SECONDS, aggregate=False):
+        if self.embedded_box is None:
+            return True
+        if self.confirmed and aggregate:
+            # An aggregated identity is settled: only a drift (or a lost track) embeds again
+            return iou(self.box, self.embedded_box) < drift_iou
+        if not self.confirmed:
+            refresh_seconds = min(refresh_seconds, unconfirmed_seconds * 2 ** max(self.misses - 1, 0))
+        if now - self.embedded_at >= refresh_seconds:
+            return True
+        return iou(self.box, self.embedded_box) < drift_iou
+
+    def aggregate(self, embedding, weight, reset_similarity=TRACK_AGGREGATE_RESET):
+        """Fold one frame's embedding into the track's weighted mean and return the normalised mean"""
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        if self._embedding_sum is not None:
+            mean = self._embedding_sum / (np.linalg.norm(self._embedding_sum) or 1.0)
+            if float(mean @ vector) < reset_similarity:
+                self._embedding_sum = None
+        if self._embedding_sum is None:
+            self._embedding_sum = np.zeros_like(vector)
+            self.frames = 0
+        self._embedding_sum += weight * vector
+        self.frames += 1
+        return self._embedding_sum / (np.linalg.norm(self._embedding_sum) or 1.0)
+
+    def record(self, name, similarity, confirmed, now):
+        self.name = name
+        self.similarity = similarity
+        self.confirmed = confirmed
+        self.misses = 0 if confirmed else self.misses + 1
+        self.embedded_box = self.box
+        self.embedded_at = now
+
+
+class FaceTracker:
+    """Greedy IoU tracker over MTCNN boxes for one Socket.IO session"""
+
+    def __init__(self, match_iou=TRACK_MATCH_IOU, max_age=TRACK_MAX_AGE):
+        self.match_iou = match_iou
+        self.max_age = max_age
+        self.tracks = []
+        self._next_id = 1
+
+    def update(self, boxes, now=None):
+        """Assign each box in this frame to a track, creating new tracks as needed"""
+        now = now if now is not None else time.time()
+        self.tracks = [t for t in self.tracks if now - t.last_seen <= self.max_age]
+
+        pairs = sorted(
+            ((iou(track.box, box), ti, bi) for ti, track in enumerate(self.tracks) for bi, box in enumerate(boxes)),
+            reverse=True
+        )
+        assigned = [None] * len(boxes)
+        used = set()
+        for score, ti, bi in pairs:
+            if score < self.match_iou:
+                break
+            if ti in used or assigned[bi] is not None:
+                continue
+            used.add(ti)
+            assigned[bi] = self.tracks[ti]
+
+        for bi, box in enumerate(boxes):
+            if assigned[bi] is None:
+                assigned[bi] = Track(self._next_id, box, now)
+                self._next_id += 1
+                self.tracks.append(assigned[bi])
+            assigned[bi].box = box
+            assigned[bi].last_seen = now
+        return assigned
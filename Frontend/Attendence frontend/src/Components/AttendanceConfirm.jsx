@@ -1,15 +1,37 @@
-import React, { useState } from 'react';
+import React, { useEffect, useState } from 'react';
 import { useLocation } from 'react-router-dom';
 import axios from 'axios';
 import '../CSS/AttendanceConfirm.css';
 
 function SubmitAttendance() {
     const location = useLocation();
-    const { attendanceList, selectedOptionsIntake, selectedOptionsCourse } = location.state || {};
+    const { attendanceList, attendanceSession, selectedOptionsIntake, selectedOptionsCourse } = location.state || {};
     
     const [subject, setSubject] = useState('');
     const [attendedBy, setAttendedBy] = useState('');
     const [isSubmitting, setIsSubmitting] = useState(false);
+    const [sessionStudents, setSessionStudents] = useState(null);
+    const [sessionUnavailable, setSessionUnavailable] = useState(false);
+
+    // With a server-side session, show exactly who the server will save
+    useEffect(() => {
+        if (!attendanceSession) return;
+        axios.get(`http://localhost:5000/api/attendance/session/${attendanceSession}`)
+            .then((res) => setSessionStudents(res.data.students))
+            .catch((err) => {
+                // Nothing saved for the session yet means nobody was seen
+                if (err.response && err.response.status === 404) {
+                    setSessionStudents([]);
+                } else {
+                    // Fall back to the list this page was given rather than block the save
+                    console.error(err);
+                    setSessionUnavailable(true);
+                }
+            });
+    }, [attendanceSession]);
+
+    const useServerSession = Boolean(attendanceSession) && !sessionUnavailable;
+    const confirmedList = useServerSession ? sessionStudents : attendanceList;
 
     const handleSubmit = async () => {
         if (!subject) {
@@ -20,7 +42,12 @@ function SubmitAttendance() {
         setIsSubmitting(true);
 
         try {
-            await axios.post('http://localhost:5000/save_attendance', {
+            // The server already holds who was seen in the session, so only send the list as a fallback
+            await axios.post('http://localhost:5000/save_attendance', useServerSession ? {
+                sessionId: attendanceSession,
+                subject,
+                attendedBy
+            } : {
                 attendanceList,
                 intake: selectedOptionsIntake[0],
                 course: selectedOptionsCourse[0],
@@ -79,16 +106,31 @@ function SubmitAttendance() {
                             <strong>Course:</strong> {selectedOptionsCourse[0]}
                         </p>
                     )}
-                    {attendanceList && (
+                    {confirmedList && (
+                        <p className="attendance-confirm-detail">
+                            <strong>Total Students:</strong> {confirmedList.length}
+                        </p>
+                    )}
+                    {useServerSession && confirmedList && confirmedList.length > 0 && (
+                        <ul className="attendance-confirm-students">
+                            {confirmedList.map((student) => (
+                                <li key={student.id}>{student.name} ({student.id})</li>
+                            ))}
+                        </ul>
+                    )}
+                    {useServerSession && !confirmedList && (
+                        <p className="attendance-confirm-detail">Loading session attendance...</p>
+                    )}
+                    {sessionUnavailable && (
                         <p className="attendance-confirm-detail">
-                            <strong>Total Students:</strong> {attendanceList.length}
+                            Could not load the server's attendance for this session; the list recorded on this device will be saved.
                         </p>
                     )}
                 </div>
                 <div className="attendance-confirm-buttons">
                     <button 
                         onClick={handleSubmit} 
-                        disabled={isSubmitting}
+                        disabled={isSubmitting || (useServerSession && !confirmedList)}
                         className="attendance-confirm-submit-button"
                     >
                         {isSubmitting ? 'Saving...' : 'Save Attendance'}
@@ -22,6 +22,9 @@ function TakeAttendenceCamera() {
     const belowThresholdFacesRef = useRef({});
     const pendingFramesRef = useRef(0); // Track pending frame requests
     const maxPendingFrames = 2; // Don't send more frames if we have this many pending
+    const targetFpsRef = useRef(10); // Frame rate the server says it can keep up with
+    const lastFrameSentRef = useRef(0);
+    const attendanceSessionRef = useRef(null); // Server-side presence for this lecture
 
     // Get selected intakes and courses from location state
     const { selectedOptionsIntake, selectedOptionsCourse } = location.state || {};
@@ -37,7 +40,24 @@ function TakeAttendenceCamera() {
         
         setSocket(newSocket);
     
-        newSocket.on('connect', () => console.log('Connected to server'));
+        newSocket.on('connect', () => {
+            console.log('Connected to server');
+            // A reconnect gets a new socket id, so resume the server-side session under it
+            if (runningRef.current) {
+                newSocket.emit('start_recognition', {
+                    intake: selectedOptionsIntake,
+                    course: selectedOptionsCourse,
+                    attendance_session: attendanceSessionRef.current
+                }, (res) => {
+                    if (res && res.status === 'success') {
+                        attendanceSessionRef.current = res.attendance_session || attendanceSessionRef.current;
+                        pendingFramesRef.current = 0;
+                    } else {
+                        console.error("Failed to resume recognition:", res);
+                    }
+                });
+            }
+        });
         
         // Handle server responses
         newSocket.on('recognition_event', (data) => {
@@ -141,8 +161,11 @@ function TakeAttendenceCamera() {
         });
 
         // Handle frame_processed event to track pending frames
-        newSocket.on('frame_processed', () => {
+        newSocket.on('frame_processed', (data) => {
             pendingFramesRef.current = Math.max(0, pendingFramesRef.current - 1);
+            if (data && data.target_fps) {
+                targetFpsRef.current = data.target_fps;
+            }
         });
     
         return () => {
@@ -557,9 +580,11 @@ function TakeAttendenceCamera() {
                 // Inform server to prepare recognition resources
                 socket.emit('start_recognition', { 
                     intake: selectedOptionsIntake, 
-                    course: selectedOptionsCourse 
+                    course: selectedOptionsCourse,
+                    attendance_session: attendanceSessionRef.current
                 }, (res) => {
                     if (res && res.status === 'success') {
+                        attendanceSessionRef.current = res.attendance_session || null;
                         setRunning(true);
                         runningRef.current = true;
                         pendingFramesRef.current = 0;
@@ -601,6 +626,14 @@ function TakeAttendenceCamera() {
         const ctx = canvas.getContext('2d');
         
         if (!video || video.readyState !== 4) return;
+
+        // Don't send faster than the server can process
+        const now = Date.now();
+        if (now - lastFrameSentRef.current < 1000 / targetFpsRef.current) {
+            updateCanvas();
+            return;
+        }
+        lastFrameSentRef.current = now;
         
         // Use smallest possible size for faster processing
         canvas.width = 160; // Even smaller than 240 for fast transfer
@@ -608,19 +641,26 @@ function TakeAttendenceCamera() {
         
         ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
         
-        // Use JPEG with lower quality for faster transfer
-        const imageData = canvas.toDataURL('image/jpeg', 0.5);
-        
         // Increment pending frames counter
         pendingFramesRef.current++;
-        
-        // Send to server with selected intake/course information
-        socket.emit('process_frame', { 
-            image: imageData,
-            timestamp: Date.now(), // Add timestamp for tracking latency
-            selectedIntakes: selectedOptionsIntake,
-            selectedCourses: selectedOptionsCourse
-        });
+        const timestamp = Date.now(); // Add timestamp for tracking latency
+
+        // Use JPEG with lower quality for faster transfer, sent as a binary attachment
+        canvas.toBlob((blob) => {
+            if (!blob) {
+                pendingFramesRef.current = Math.max(0, pendingFramesRef.current - 1);
+                return;
+            }
+            blob.arrayBuffer().then((imageData) => {
+                // Send to server with selected intake/course information
+                socket.emit('process_frame', {
+                    image: imageData,
+                    timestamp,
+                    selectedIntakes: selectedOptionsIntake,
+                    selectedCourses: selectedOptionsCourse
+                });
+            });
+        }, 'image/jpeg', 0.5);
         
         // Always update the canvas for smooth experience
         updateCanvas();
@@ -656,6 +696,7 @@ function TakeAttendenceCamera() {
         navigate('/attendanceconfirm', {
             state: {
                 attendanceList,
+                attendanceSession: attendanceSessionRef.current,
                 selectedOptionsIntake,
                 selectedOptionsCourse
             }